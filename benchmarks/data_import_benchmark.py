@@ -0,0 +1,294 @@
+'''
+Benchmarks for the data import pipeline (qncmbe.data_import.data_import_utils), run on synthetic data.
+
+Times each stage separately and then the whole get_data() import, for a range of:
+	- window lengths (1 hour to 90 days)
+	- numbers of Molly signals (1 to all of value_names_database)
+	- Molly time steps (delta_t)
+
+Stages:
+	- get_line_numbers: parsing one Molly header file (cold, and with the header cache)
+	- get_data_from_binary: decoding one Molly binary file
+	- get_raw_Molly_data: reading all the hour files in the window
+	- resample_Molly_data: resampling that raw data onto the delta_t grid
+	- get_Molly_data: both of the above
+	- get_BET_data, get_SVT_data
+	- import_to_csv: writing the get_data() output to a .csv file
+	- get_data: everything, end to end
+
+Stages which read files are timed twice: 'cold', with all the import caches cleared before each repeat (see clear_caches()),
+and 'warm', with the caches filled by the previous repeat.
+
+The synthetic data (see synthetic_data.py) is generated the first time and then reused, so that runs are comparable.
+Results are saved as JSON, and two results files can be compared with --compare.
+
+Usage:
+	python data_import_benchmark.py                        (full suite)
+	python data_import_benchmark.py --quick                (short windows only, for a quick check)
+	python data_import_benchmark.py --compare old.json new.json
+'''
+
+# Standard library imports (not included in setup.py)
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time as tm
+
+# qncmbe imports
+import qncmbe.data_import.data_import_utils as datimp
+from qncmbe.data_import.synthetic_data import generate_data_root
+from qncmbe.data_import.value_names import value_names_database
+
+# Non-standard library imports (included in setup.py)
+import numpy as np
+
+# Synthetic data covers this whole range, and all windows start at window_start
+data_start = dt.datetime(2019, 1, 1)
+data_end = dt.datetime(2019, 4, 3)
+window_start = dt.datetime(2019, 1, 2, 8)
+
+window_lengths = {
+	'1h': dt.timedelta(hours = 1),
+	'6h': dt.timedelta(hours = 6),
+	'1d': dt.timedelta(days = 1),
+	'7d': dt.timedelta(days = 7),
+	'30d': dt.timedelta(days = 30),
+	'90d': dt.timedelta(days = 90)
+}
+quick_windows = ['1h', '6h', '1d']
+
+signal_counts = [1, 10, 'all']
+delta_ts = [2.0, 60.0, 900.0]
+
+# Skip resampled cases with more than this many output values (points times signals), to keep memory reasonable
+max_output_values = 5e7
+
+def main():
+
+	parser = argparse.ArgumentParser(description = 'Benchmarks for the qncmbe data import pipeline')
+	parser.add_argument('--root', default = os.path.join(tempfile.gettempdir(), 'qncmbe_benchmark_data'), help = 'directory for the synthetic data')
+	parser.add_argument('--out', default = None, help = 'output .json file (default: benchmark_<date>.json)')
+	parser.add_argument('--quick', action = 'store_true', help = 'only run the short windows')
+	parser.add_argument('--repeat', type = int, default = 3, help = 'number of repeats for each measurement (best is reported)')
+	parser.add_argument('--compare', nargs = 2, metavar = ('OLD', 'NEW'), help = 'compare two results files instead of running')
+	args = parser.parse_args()
+
+	if args.compare:
+		compare_results(*args.compare)
+		return
+
+	prepare_data_root(args.root)
+	datimp.set_data_root(args.root)
+
+	windows = quick_windows if args.quick else list(window_lengths)
+
+	results = run_benchmarks(windows, args.repeat)
+
+	out_path = args.out or f'benchmark_{dt.datetime.now():%Y-%m-%d_%H%M%S}.json'
+	with open(out_path, 'w') as f:
+		json.dump({'info': get_run_info(args), 'results': results}, f, indent = 1)
+
+	print(f'Saved results to {out_path}')
+
+def prepare_data_root(root_dir):
+	'''
+	Generates the synthetic data in root_dir, unless it's already there (with the same parameters)
+	'''
+
+	params = {'start': str(data_start), 'end': str(data_end), 'seed': 0}
+	params_path = os.path.join(root_dir, 'benchmark_data.json')
+
+	if os.path.exists(params_path):
+		with open(params_path, 'r') as f:
+			if json.load(f) == params:
+				return
+
+	print(f'Generating synthetic data in {root_dir} (only needed once)...')
+	t = tm.time()
+	stats = generate_data_root(root_dir, data_start, data_end, seed = params['seed'])
+	print(f"Wrote {stats['files']} files ({stats['bytes']/1e9:.2f} GB) in {tm.time() - t:.0f} s")
+
+	with open(params_path, 'w') as f:
+		json.dump(params, f)
+
+def get_run_info(args):
+	'''
+	Information about the run, so that results from different machines/versions can be told apart
+	'''
+
+	try:
+		commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.DEVNULL).decode().strip()
+	except Exception:
+		commit = None
+
+	return {
+		'date': dt.datetime.now().isoformat(),
+		'commit': commit,
+		'python': sys.version,
+		'numpy': np.__version__,
+		'platform': platform.platform(),
+		'data root': args.root,
+		'repeat': args.repeat,
+		'quick': args.quick
+	}
+
+def time_call(func, *args, repeat = 3, setup = None):
+	'''
+	Returns (best time, median time, output) over repeat calls of func(*args). setup() is called before each call, untimed.
+	'''
+
+	times = []
+	for n in range(repeat):
+		if setup is not None:
+			setup()
+
+		t = tm.perf_counter()
+		out = func(*args)
+		times.append(tm.perf_counter() - t)
+
+	return min(times), float(np.median(times)), out
+
+def clear_caches():
+	'''
+	Clears all the in-memory caches of data_import_utils, so the next import reads everything again.
+	(The benchmarks don't call set_cache_dir(), so there are no caches on disk.)
+	'''
+
+	datimp.header_index_cache.clear()
+	datimp.file_catalog.clear()
+	datimp.parsed_file_cache.clear()
+
+def get_Molly_names(count):
+	names = [vn['Local value name'] for vn in value_names_database.values() if vn['Location'] == 'Molly']
+	names = [name for name in names if name != 'Time']
+
+	if count == 'all':
+		return names
+
+	# Spread through the database, so that the signals aren't all next to each other in the files
+	return [names[n] for n in np.linspace(0, len(names) - 1, count).astype(int)]
+
+def run_benchmarks(windows, repeat):
+
+	results = []
+
+	def record(stage, best, median, **case):
+		result = {'stage': stage, **case, 'best (s)': best, 'median (s)': median}
+		results.append(result)
+
+		case_str = ', '.join(f'{key} = {val}' for key, val in case.items())
+		print(f'{stage:<22} {best*1e3:10.2f} ms   {case_str}')
+
+	def record_cold_warm(stage, func, *args, **case):
+		# Cold: every repeat starts with empty caches. Warm: the caches are already filled (by the last cold repeat, and then by the previous warm repeat).
+		best, median, out = time_call(func, *args, repeat = repeat, setup = clear_caches)
+		record(stage, best, median, **case, cache = 'cold')
+
+		best, median, out = time_call(func, *args, repeat = repeat)
+		record(stage, best, median, **case, cache = 'warm')
+
+		return out
+
+	# Single-file stages
+	header_path, binary_path = datimp.get_filepaths(window_start)
+
+	for count in signal_counts:
+		names = get_Molly_names(count)
+
+		best, median, _ = time_call(datimp.get_line_numbers, header_path, names, repeat = repeat, setup = clear_caches)
+		record('get_line_numbers', best, median, num_signals = len(names), cache = 'cold')
+
+		best, median, (total_values, values_offset) = time_call(datimp.get_line_numbers, header_path, names, repeat = repeat)
+		record('get_line_numbers', best, median, num_signals = len(names), cache = 'warm')
+
+		best, median, _ = time_call(datimp.get_data_from_binary, binary_path, total_values, values_offset, names, repeat = repeat)
+		record('get_data_from_binary', best, median, num_signals = len(names))
+
+	# Window stages
+	for window in windows:
+		end_time = window_start + window_lengths[window]
+		tot_seconds = window_lengths[window].total_seconds()
+
+		for count in signal_counts:
+			names = get_Molly_names(count)
+			case = {'window': window, 'num_signals': len(names)}
+
+			raw_data = record_cold_warm('get_raw_Molly_data', datimp.get_raw_Molly_data, window_start, end_time, names, **case)
+			for result in results[-2:]:
+				result['raw_events'] = int(sum(raw_data[name]['time'].size for name in names))
+
+			# Same shift as get_Molly_data()
+			offset = (window_start - window_start.replace(hour = 0, minute = 0, second = 0, microsecond = 0)).total_seconds()
+			for name in names:
+				raw_data[name]['time'] = raw_data[name]['time'] - offset
+
+			for delta_t in delta_ts:
+				num_points = int(tot_seconds/delta_t) + 1
+				if num_points*len(names) > max_output_values:
+					continue
+
+				for mode in ['step', 'linear']:
+					time_interp = np.arange(0.0, tot_seconds + 1e-3*delta_t, delta_t)
+
+					best, median, _ = time_call(datimp.resample_Molly_data, raw_data, time_interp, mode, repeat = repeat)
+					record('resample_Molly_data', best, median, **case, delta_t = delta_t, mode = mode)
+
+				record_cold_warm('get_Molly_data', datimp.get_Molly_data, window_start, end_time, names, delta_t, **case, delta_t = delta_t)
+
+			del raw_data
+
+		record_cold_warm('get_BET_data', datimp.get_BET_data, window_start, end_time, ['BET Time', 'BET Temp', 'ISP Time', 'ISP Integral', 'ISP Temp'], window = window)
+
+		SVT_names = [vn['Local value name'] for vn in value_names_database.values() if vn['Location'] == 'SVT']
+		record_cold_warm('get_SVT_data', datimp.get_SVT_data, window_start, end_time, SVT_names, window = window)
+
+		# End to end, with all values (as in the Origin import wizard)
+		value_names_list = list(value_names_database)
+		for delta_t in delta_ts:
+			num_points = int(tot_seconds/delta_t) + 1
+			if num_points*len(value_names_list) > max_output_values:
+				continue
+
+			data = record_cold_warm('get_data', datimp.get_data, window_start, end_time, value_names_list, delta_t, window = window, num_signals = len(value_names_list), delta_t = delta_t)
+
+			# import_to_csv needs all the columns to be the same length, so only the Molly values are written
+			Molly_names = [name for name in value_names_list if value_names_database[name]['Location'] == 'Molly']
+			with tempfile.TemporaryDirectory() as tmp_dir:
+				csv_path = os.path.join(tmp_dir, 'benchmark.csv')
+				best, median, _ = time_call(datimp.import_to_csv, Molly_names, {name: data[name] for name in Molly_names}, csv_path, repeat = repeat)
+				record('import_to_csv', best, median, window = window, num_signals = len(Molly_names), delta_t = delta_t, bytes = os.path.getsize(csv_path))
+
+			del data
+
+	return results
+
+def compare_results(old_path, new_path):
+	'''
+	Prints the speedup (old time/new time) for every measurement in both results files
+	'''
+
+	def load(path):
+		with open(path, 'r') as f:
+			results = json.load(f)['results']
+
+		keyed = {}
+		for result in results:
+			case = tuple((key, val) for key, val in result.items() if key not in ('best (s)', 'median (s)', 'raw_events', 'bytes'))
+			keyed[case] = result['best (s)']
+		return keyed
+
+	old = load(old_path)
+	new = load(new_path)
+
+	for case in old:
+		if case in new:
+			case_str = ', '.join(f'{key} = {val}' for key, val in case)
+			print(f'{old[case]/new[case]:7.2f}x   {old[case]*1e3:10.2f} ms -> {new[case]*1e3:10.2f} ms   {case_str}')
+
+if __name__ == '__main__':
+	main()
@@ -64,7 +64,7 @@ beam_efficiency = {
 }
 
 class CellUsageCalculator():
-    def __init__(self, start_date, end_date, cells, cell_pars_file, save_dir = '.\\saved_cell_data', delta_t = 300, regen_data = False):
+    def __init__(self, start_date, end_date, cells, cell_pars_file, save_dir = '.\\saved_cell_data', delta_t = 300, regen_data = False, archive = None):
         '''
         - start_date and end_date should be strings of the form 'YYYY-MM-DD'
         - cells should be a list of cells (e.g., ['Ga1','Ga2','Al1'])
@@ -73,6 +73,7 @@ class CellUsageCalculator():
             (To avoid collecting enormous amounts of data from Molly at once (takes a very long time), data is loaded one day at a time and saved into save_dir.)
         - delta_t is the spacing (s) between data samples. Default is 300 s (5 min)
         - regen_data determines whether or not to regenerate the Cell_data_yyyy-mm-dd.csv files. Should set this to True if, e.g., you've added an additional cell since the last run
+        - archive can be a MollyArchive (see data_import/molly_archive.py), in which case temperature data is read from the local archive instead of the server where possible
         '''
 
         fmt_str = '%Y-%m-%d'
@@ -90,6 +91,8 @@ class CellUsageCalculator():
 
         self.regen_data = regen_data
 
+        self.archive = archive
+
 
         self.cells = cells
         if not set(self.cells).issubset(set(valid_cells)):
@@ -144,7 +147,8 @@ class CellUsageCalculator():
                             end_time = day + delta,
                             value_names_list = self.value_names_list,
                             delta_t = self.delta_t,
-                            interp = True)
+                            interp = True,
+                            archive = self.archive)
 
                 t = data['Molly time']
 
@@ -0,0 +1,115 @@
+'''
+Asyncio version of get_data(), for interactive programs which shouldn't freeze while data is imported.
+
+get_data() reads everything one file at a time, and waits on the network for each one.
+get_data_async() instead starts all the reads at once (up to max_concurrency at a time) in worker threads:
+the Molly hour files (header and binary), and the BET/ISP and SVT directory listings and files.
+So the wall time is roughly that of the slowest reads, rather than the sum of all of them.
+
+The query runs as an asyncio task, so it can be cancelled, e.g.:
+	task = asyncio.ensure_future(get_data_async(start_time, end_time, value_names_list, delta_t))
+	...
+	task.cancel()
+
+Reads which have already started will finish in the background (threads can't be interrupted), but nothing new is started.
+
+The results are exactly the same as for get_data().
+'''
+
+# Standard library imports (not included in setup.py)
+import asyncio
+import functools
+
+# qncmbe imports
+from . import data_import_utils as datimp
+from .value_names import value_names_database
+
+# Non-standard library imports (included in setup.py)
+import numpy as np
+
+async def get_data_async(start_time, end_time, value_names_list, delta_t = -1, interp = False, archive = None, mode = None, num_points = None, index = None, max_concurrency = 8, value_dtype = np.float64, time_unit = 's'):
+	'''
+	Same as get_data() (see data_import_utils.py), but as a coroutine.
+
+	- max_concurrency is the maximum number of files read at once
+	- The other arguments are the same as for get_data(). (There is no num_threads, since all the reads are already done concurrently.)
+	'''
+
+	local_value_names = datimp.get_local_value_names(value_names_list)
+
+	loop = asyncio.get_running_loop()
+	semaphore = asyncio.Semaphore(max_concurrency)
+
+	async def run(func, *args):
+		# Runs func(*args) in a worker thread, once there is a free slot
+		async with semaphore:
+			return await loop.run_in_executor(None, functools.partial(func, *args))
+
+	# Generate dictionary of data for each location, all at once
+	Molly_data, BET_data, SVT_data = await asyncio.gather(
+		get_Molly_data_async(start_time, end_time, local_value_names["Molly"], delta_t, interp, archive, mode, num_points, index, run, value_dtype, time_unit),
+		run(datimp.get_BET_data, start_time, end_time, local_value_names["BET"], value_dtype, time_unit),
+		run(datimp.get_SVT_data, start_time, end_time, local_value_names["SVT"], value_dtype, time_unit)
+	)
+
+	# Generate dictionary of all data
+	data = {**Molly_data, **BET_data, **SVT_data}
+
+	# Convert from local value names to readable value names
+	for val in value_names_list:
+		data[val] = data.pop(value_names_database[val]['Local value name'])
+
+	return data
+
+async def get_Molly_data_async(start_time, end_time, value_names, delta_t, interp, archive, mode, num_points, index, run, value_dtype = np.float64, time_unit = 's'):
+	'''
+	Same as get_Molly_data(), but reads the hour files concurrently. run is the coroutine from get_data_async() which runs a function in a worker thread.
+	'''
+
+	if not value_names: return {}
+
+	if mode == 'envelope':
+		# Envelope data is streamed one day at a time, so it's read in a single worker thread
+		return await run(datimp.get_Molly_data, start_time, end_time, value_names, delta_t, interp, 1, archive, mode, num_points, index, value_dtype, time_unit)
+
+	if num_points is not None:
+		if num_points < 2:
+			raise Exception("num_points must be at least 2")
+		delta_t = (end_time - start_time).total_seconds()/(num_points - 1)
+
+	raw_value_names = [name for name in value_names if name != "Time"]
+
+	if mode is None:
+		mode = 'linear' if interp else 'step'
+
+	if (delta_t == -1) or (mode != 'step'):
+		index = None
+
+	# Same as get_raw_Molly_data(), but with all the hours read at once
+	hours, start_day = datimp.get_Molly_hours(start_time, end_time)
+
+	if index is not None:
+		hours, boundary_events = await run(index.skip_hours, hours, raw_value_names, start_day, True)
+
+	if archive is not None:
+		get_hour = archive.get_raw_Molly_data_hour
+	else:
+		get_hour = datimp.get_raw_Molly_data_hour
+
+	data_hours = await asyncio.gather(*[run(get_hour, hour, raw_value_names) for hour in hours])
+
+	def combine_hours():
+		raw_data = datimp.combine_Molly_hours(hours, data_hours, raw_value_names, start_day)
+		for name in raw_value_names:
+			raw_data[name]['vals'] = raw_data[name]['vals'].astype(value_dtype, copy = False)
+
+		if index is not None:
+			raw_data = datimp.add_boundary_events(raw_data, boundary_events, raw_value_names)
+
+		return raw_data
+
+	# Combining the hours and resampling can take a while for long time ranges (e.g., a month of all the signals),
+	# so they are also done in worker threads, to keep the event loop free
+	raw_data = await run(combine_hours)
+
+	return await run(datimp.process_raw_Molly_data, raw_data, start_time, end_time, value_names, delta_t, mode, value_dtype, time_unit)
@@ -1,19 +1,37 @@
 # Standard library imports (not included in setup.py)
 import datetime as dt
 import os
-from glob import glob
 import re
-import struct
 import time as tm
 import csv
+import warnings
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # qncmbe imports
 from .value_names import value_names_database
+from . import import_profile as prof
 
 # Non-standard library imports (included in setup.py)
 import numpy as np
 
-def get_data(start_time, end_time, value_names_list, delta_t = -1, interp = False):
+# Locations of the lab data on the server
+server_production_data_path = r"\\insitu1.nexus.uwaterloo.ca\Documents\QNC MBE Data\Production Data"
+server_SVT_data_path = r"\\insitu1.nexus.uwaterloo.ca\QNC_MBE_Data\ZW-XP1"
+
+# Locations actually used for data imports. Can be pointed at a local copy with set_data_root(), or by setting the QNCMBE_DATA_ROOT environment variable.
+# (E.g., see data_sync.py and synthetic_data.py)
+production_data_path = server_production_data_path
+SVT_data_path = server_SVT_data_path
+
+# Original (ctime, mtime) timestamps for files whose own timestamps can't be trusted (e.g., copies of the server files), keyed on normalized path
+file_times = {}
+
+def get_data(start_time, end_time, value_names_list, delta_t = -1, interp = False, num_threads = 1, archive = None, mode = None, num_points = None, index = None, parallel = False, profile = None, value_dtype = np.float64, time_unit = 's', num_processes = 1):
 	'''
 	Primary function for getting data from various computers in the QNC-MBE lab.
 
@@ -21,6 +39,20 @@ def get_data(start_time, end_time, value_names_list, delta_t = -1, interp = Fals
 	- value_names_list should be a list of strings. They must correspond to entries in the first column of value_names_database.csv
 	- delta_t should be the desired time resolution of Molly data in seconds.
 	- intrp is a bool determining whether to linearly interpolate (True) or step interpolate (False) the data
+	- num_threads is the number of Molly hour files to fetch from the server at once (see get_raw_Molly_data())
+	- archive can be a MollyArchive (see molly_archive.py), in which case Molly data is read from the local archive where possible
+	- mode overrides interp, to resample Molly data in other ways: 'linear', 'step', 'mean', 'min', 'max', 'last', or 'envelope' (see resample_Molly_data())
+	- num_points can be given instead of delta_t, to get that many evenly spaced points from start_time to end_time.
+		E.g., for plotting months of data, use mode = 'envelope' and num_points = 2000 or so.
+		Then each Molly value is a dictionary of 'min' and 'max' arrays, so short spikes still show up. (See get_Molly_data())
+	- index can be a MollyChangeIndex (see molly_index.py). For step-interpolated data, hour files where none of the values changed are then skipped.
+	- parallel is a bool. If True, the Molly, BET, and SVT data are fetched at the same time (in separate threads), so the total time is that of the slowest one.
+	- profile turns on profiling (see import_profile.py). It can be an ImportProfile, which is filled in with the timing breakdown and I/O statistics,
+		or a function, which is called with a new ImportProfile once the import is done.
+	- value_dtype is the numpy dtype of all the (non-time) values. E.g., np.float32 halves the memory used by long imports.
+		(Molly stores values as float32 anyway, so nothing is lost for Molly data.)
+	- time_unit is the format of all the time arrays: 's' for float64 seconds, or 'ms' for int64 milliseconds. (See convert_time())
+	- num_processes is the number of processes used to parse BET/ISP and SVT files, when the time range covers several of them (see load_log_files())
 	
 	Returns 'data': a dictionary of numpy arrays, with keys corresponding to the value_names_list
 
@@ -41,6 +73,50 @@ def get_data(start_time, end_time, value_names_list, delta_t = -1, interp = Fals
 	If delta_t = -1, then your time array would be data['Ga1 tip measured']['time'] and your values array would be data['Ga1 tip measured']['vals']
 	'''
 
+	if profile is not None:
+		import_profile = profile if isinstance(profile, prof.ImportProfile) else prof.ImportProfile()
+
+		with prof.profiling(import_profile):
+			data = get_data(start_time, end_time, value_names_list, delta_t, interp, num_threads, archive, mode, num_points, index, parallel, None, value_dtype, time_unit, num_processes)
+
+		if import_profile is not profile:
+			profile(import_profile)
+
+		return data
+
+	local_value_names = get_local_value_names(value_names_list)
+
+	# Generate dictionary of data for each location
+
+	fetchers = [
+		(get_Molly_data, (start_time, end_time, local_value_names["Molly"], delta_t, interp, num_threads, archive, mode, num_points, index, value_dtype, time_unit)),
+		(get_BET_data, (start_time, end_time, local_value_names["BET"], value_dtype, time_unit, num_processes)),
+		(get_SVT_data, (start_time, end_time, local_value_names["SVT"], value_dtype, time_unit, num_processes))
+	]
+
+	if parallel:
+		# The three locations are completely separate files, so there's no need to wait for one before starting the next
+		with ThreadPoolExecutor(max_workers = 3) as executor:
+			futures = [executor.submit(func, *args) for func, args in fetchers]
+			Molly_data, BET_data, SVT_data = [future.result() for future in futures]
+	else:
+		Molly_data, BET_data, SVT_data = [func(*args) for func, args in fetchers]
+
+	# Generate dictionary of all data
+	data = {**Molly_data, **BET_data, **SVT_data}
+
+	# Convert from local value names to readable value names
+	for val in value_names_list:
+		data[val] = data.pop(value_names_database[val]['Local value name'])
+
+	return data
+
+def get_local_value_names(value_names_list):
+	'''
+	Sorts value_names_list by location.
+	Returns a dictionary with keys "Molly", "BET", and "SVT", each holding a list of the corresponding local value names.
+	'''
+
 	local_value_names = {
 		"Molly": [],
 		"BET": [],
@@ -51,20 +127,23 @@ def get_data(start_time, end_time, value_names_list, delta_t = -1, interp = Fals
 			raise Exception('Invalid value "{}" in value_names_list. Not found in value_names_database'.format((val)))
 		local_value_names[value_names_database[val]['Location']].append(value_names_database[val]['Local value name'])
 
-	# Generate dictionary of data for each location
+	return local_value_names
 
-	Molly_data = get_Molly_data(start_time, end_time, local_value_names["Molly"], delta_t, interp)
-	BET_data = get_BET_data(start_time, end_time, local_value_names["BET"])
-	SVT_data = get_SVT_data(start_time, end_time, local_value_names["SVT"])
+time_units = ['s', 'ms']
 
-	# Generate dictionary of all data
-	data = {**Molly_data, **BET_data, **SVT_data}
-
-	# Convert from local value names to readable value names
-	for val in value_names_list:
-		data[val] = data.pop(value_names_database[val]['Local value name'])
+def convert_time(time, time_unit = 's'):
+	'''
+	Converts an array of times in seconds to the given time unit:
+	- 's': float64 seconds (unchanged)
+	- 'ms': int64 milliseconds, rounded to the nearest millisecond
+	'''
 
-	return data
+	if time_unit == 's':
+		return time
+	elif time_unit == 'ms':
+		return np.round(time*1000).astype(np.int64)
+	else:
+		raise Exception(f'Invalid time unit "{time_unit}". Allowed time units are {time_units}')
 
 def get_value_names_list(location = "all"):
 	'''
@@ -79,7 +158,7 @@ def get_value_names_list(location = "all"):
 
 	return value_names_list
 
-def get_raw_Molly_data(start_time, end_time, value_names):
+def get_raw_Molly_data(start_time, end_time, value_names, num_threads = 1, archive = None, index = None, value_dtype = np.float64):
 	'''
 	Gets raw Molly data (uneven timesteps, unique time array for each value)
 	Since the files are stored in one-hour chunks, it loops through hour by hour.
@@ -87,10 +166,56 @@ def get_raw_Molly_data(start_time, end_time, value_names):
 	This function returns all the one-hour chunks necessary to cover start_time to end_time.
 	It also includes an extra hour buffer on each end for safety.
 
+	If num_threads > 1, up to num_threads hour files are fetched from the server at once.
+	(The results are identical, but long time ranges are much faster since most of the time is spent waiting on the network.)
+
+	If archive is given (a MollyArchive), the hour data is read from the local archive instead, wherever it is available.
+	Otherwise, the data is read by assemble_raw_Molly_data().
+
+	If index is given (a MollyChangeIndex), hours where none of the values changed are not read.
+	Instead, there is a single event at the start of each of those hours, with the value in force. (See molly_index.py)
+	The value in force at the start is also taken from the index, so the extra hours on each end are usually not needed either.
+	This gives exactly the same step-interpolated data, but fewer raw events.
+
+	value_dtype is the dtype of the 'vals' arrays. (Molly stores them as float32.)
+
 	Return value is a dictionary with keys equal to value names.
 	Each dictionary element is another dictionary with two keys: 'time' (containing a numpy time array) and 'vals' (containing a numpy value array)
 	'''
 
+	hours, start_day = get_Molly_hours(start_time, end_time)
+
+	if index is not None:
+		hours, boundary_events = index.skip_hours(hours, value_names, start_day, trim = True)
+
+	if archive is None:
+		data = assemble_raw_Molly_data(hours, value_names, start_day, num_threads, value_dtype)
+
+	else:
+		def get_hour(hour):
+			return archive.get_raw_Molly_data_hour(hour, value_names)
+
+		with ThreadPoolExecutor(max_workers = max(num_threads, 1)) as executor:
+
+			# map() returns the results in the same order as hours, regardless of which files finish first
+			data_hours = executor.map(get_hour, hours) if (num_threads > 1) else map(get_hour, hours)
+
+			data = combine_Molly_hours(hours, data_hours, value_names, start_day)
+
+		for name in value_names:
+			data[name]['vals'] = data[name]['vals'].astype(value_dtype, copy = False)
+
+	if index is not None:
+		data = add_boundary_events(data, boundary_events, value_names)
+
+	return data
+
+def get_Molly_hours(start_time, end_time):
+	'''
+	Returns (hours, start_day): the list of hours (datetimes) whose files are needed to cover start_time to end_time, and midnight on the first day.
+	(Molly time is relative to midnight, so times from all the hours are made relative to start_day.)
+	'''
+
 	delta = dt.timedelta(hours=1)
 
 	hour = start_time.replace(minute=0, second=0, microsecond=0)
@@ -105,53 +230,226 @@ def get_raw_Molly_data(start_time, end_time, value_names):
 	# I don't really get the logic, but it seems that including the extra hour makes things safer. I hope.
 	hour -= delta
 
+	hours = []
+	while(hour <= end_time + delta):
+		hours.append(hour)
+		hour += delta
+
 	# Since Molly time is relative to midnight, need to manually keep track of the days
 	start_day = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
-	day = hour.replace(hour=0, minute=0, second=0, microsecond=0)
 
-	data = {}
+	return hours, start_day
 
-	while(hour <= end_time + delta):
+def combine_Molly_hours(hours, data_hours, value_names, start_day):
+	'''
+	Combines the outputs of get_raw_Molly_data_hour() (data_hours, in the same order as hours) into a single dictionary, as returned by get_raw_Molly_data().
+	'''
 
-		data_hour = get_raw_Molly_data_hour(hour, value_names)
+	data = {name: {'time': [], 'vals': []} for name in value_names}
 
+	for hour, data_hour in zip(hours, data_hours):
+
+		day = hour.replace(hour=0, minute=0, second=0, microsecond=0)
 		num_days = (day - start_day).days
 
+		with prof.stage('Molly concatenation'):
+			for name in value_names:
+
+				data_hour[name]['time'] += num_days*86400
+
+				data[name]['time'].append(data_hour[name]['time'])
+				data[name]['vals'].append(data_hour[name]['vals'])
+
+	# Concatenate so that all the data is in one list
+	with prof.stage('Molly concatenation'):
 		for name in value_names:
+			data[name]['time'] = np.concatenate(data[name]['time'] + [np.zeros(0)])
+			data[name]['vals'] = np.concatenate(data[name]['vals'] + [np.zeros(0)])
 
-			#if data_hour[name]['time'][0]
+	return data
 
-			data_hour[name]['time'] += num_days*86400
+def add_boundary_events(data, boundary_events, value_names):
+	'''
+	Merges the events for the hours skipped by a MollyChangeIndex into raw Molly data (see get_raw_Molly_data()).
+	Boundary events go first, so that a recorded event at the same time takes precedence.
+	'''
 
-			if (not name in data):
-				data[name] = {'time': [], 'vals': []}
+	prof.count('Molly boundary events', sum(boundary_events[name]['time'].size for name in value_names))
 
-			data[name]['time'].append(data_hour[name]['time'])
-			data[name]['vals'].append(data_hour[name]['vals'])
+	for name in value_names:
+		time = np.concatenate([boundary_events[name]['time'], data[name]['time']])
+		vals = np.concatenate([boundary_events[name]['vals'], data[name]['vals']]).astype(data[name]['vals'].dtype, copy = False)
 
-		hour += delta
+		sort_inds = np.argsort(time, kind = 'stable')
+		data[name] = {'time': time[sort_inds], 'vals': vals[sort_inds]}
 
-		day = hour.replace(hour=0, minute=0, second=0, microsecond=0)
+	return data
 
-	# Concatenate so that all the data is in one list
+def assemble_raw_Molly_data(hours, value_names, start_day, num_threads = 1, value_dtype = np.float64):
+	'''
+	Reads the raw Molly data for the given list of hours (datetimes), in the same format as get_raw_Molly_data().
+	Times are relative to midnight on start_day.
+
+	The header files already give the number of values for each hour, so this is done in two passes.
+	First, all the headers are read, and the output arrays are allocated at their final size.
+	Then, the binary data for each hour is read directly into its place in the output.
+	This avoids building a list of arrays for every hour and then copying them all with np.concatenate.
+
+	Both passes are done with up to num_threads threads (see get_raw_Molly_data()).
+	'''
+
+	with ThreadPoolExecutor(max_workers = max(num_threads, 1)) as executor:
+
+		def run(func, args):
+			return list(executor.map(func, args) if (num_threads > 1) else map(func, args))
+
+		# First pass: headers
+		def get_hour_header(hour):
+			header_path, binary_path = get_filepaths(hour)
+			total_values, values_offset = get_line_numbers(header_path, value_names)
+
+			if total_values == -1:
+				# Missing header file
+				total_values = {name: 0 for name in value_names}
+				values_offset = {name: 0 for name in value_names}
+
+			return binary_path, total_values, values_offset
+
+		headers = run(get_hour_header, hours)
+
+		# Allocate the (time, value) pairs for each value, and find where each hour goes
+		pairs = {}
+		starts = {}
+		for name in value_names:
+			totals = np.array([total_values[name] for _, total_values, _ in headers], dtype=np.int64)
+			starts[name] = np.concatenate([[0], np.cumsum(totals)])
+			pairs[name] = np.empty((starts[name][-1], 2), dtype=np.float32)
+
+		# Second pass: binary data, read straight into the output
+		def read_hour_binary(n):
+			binary_path, total_values, values_offset = headers[n]
+
+			num_read = {name: 0 for name in value_names}
+			if not any(total_values.values()):
+				return num_read
+
+			try:
+				binary = open(binary_path, "rb")
+			except IOError:
+				print("Warning: missing binary file " + binary_path)
+				prof.count('Molly binary files missing')
+				return num_read
+
+			prof.count('Molly binary files opened')
+
+			with binary, prof.stage('Molly binary read'):
+				for name in value_names:
+					dest = pairs[name][starts[name][n]:starts[name][n+1]]
+					if dest.shape[0] == 0:
+						continue
+
+					binary.seek((values_offset[name]+1)*8)
+					num_read[name] = binary.readinto(memoryview(dest).cast('B'))//8
+
+					prof.add_bytes('Molly', num_read[name]*8)
+
+			return num_read
+
+		num_read = run(read_hour_binary, range(len(hours)))
+
+	with prof.stage('Molly concatenation'):
+		data = convert_Molly_pairs(pairs, starts, num_read, hours, value_names, start_day, value_dtype)
+
+	return data
+
+def convert_Molly_pairs(pairs, starts, num_read, hours, value_names, start_day, value_dtype = np.float64):
+	'''
+	Last step of assemble_raw_Molly_data(): drops anything which wasn't read, and converts the (time, value) pairs to the output format.
+	'''
+
+	num_days = [(hour.replace(hour=0, minute=0, second=0, microsecond=0) - start_day).days for hour in hours]
+
+	data = {}
 	for name in value_names:
-		data[name]['time'] = np.concatenate(data[name]['time'])
-		data[name]['vals'] = np.concatenate(data[name]['vals'])
+		name_pairs = pairs[name]
+
+		# If any files were missing or truncated, drop the parts that weren't filled
+		counts = np.array([n_read[name] for n_read in num_read], dtype=np.int64)
+		if counts.sum() < name_pairs.shape[0]:
+			keep = np.concatenate([np.arange(starts[name][n], starts[name][n] + counts[n]) for n in range(len(hours))] + [np.zeros(0, dtype=np.int64)])
+			name_pairs = name_pairs[keep]
 
+		ends = np.cumsum(counts)
+
+		# Same conversion as read_Molly_block(), followed by the day offset (as in get_raw_Molly_data())
+		time = name_pairs[:,0].astype(np.float64)*86400
+		for n in range(len(hours)):
+			if num_days[n] != 0:
+				time[ends[n]-counts[n]:ends[n]] += num_days[n]*86400
+
+		data[name] = {'time': time, 'vals': name_pairs[:,1].astype(value_dtype)}
 
 	return data
 
-def get_Molly_data(start_time, end_time, value_names, delta_t, interp = False):
+def get_Molly_data(start_time, end_time, value_names, delta_t, interp = False, num_threads = 1, archive = None, mode = None, num_points = None, index = None, value_dtype = np.float64, time_unit = 's'):
+	'''
+	Gets Molly data, resampled with time step delta_t (see get_data()).
+	mode can be any of the modes in resample_Molly_data(). If mode is None, it is set by interp.
+	If num_points is given, delta_t is chosen to give that many points from start_time to end_time.
+
+	mode = 'envelope' is meant for long time ranges, so it is calculated chunk by chunk with iter_Molly_data().
+	Only one day of raw data is held in memory at a time, no matter how long the time range is.
+
+	index (a MollyChangeIndex) is only used for step interpolation, since the other modes depend on every recorded event.
+	'''
 
 	if not value_names: return {} # Redundant, but increases speed.
 
+	if num_points is not None:
+		if num_points < 2:
+			raise Exception("num_points must be at least 2")
+		delta_t = (end_time - start_time).total_seconds()/(num_points - 1)
+
+	if mode == 'envelope':
+		if delta_t == -1:
+			raise Exception("mode 'envelope' needs a time step (delta_t or num_points)")
+
+		chunks = list(iter_Molly_data(start_time, end_time, value_names, delta_t, chunk = dt.timedelta(days = 1), archive = archive, mode = mode))
+
+		data = {}
+		for name in value_names:
+			if name == "Time":
+				data[name] = np.concatenate([c[name] for c in chunks])
+			else:
+				data[name] = {key: np.concatenate([c[name][key] for c in chunks]) for key in ['min', 'max']}
+
+		return convert_Molly_data(data, value_dtype, time_unit)
+
 	# Create list of values with "Time" excluded.
 	raw_value_names = list(value_names)
 	while "Time" in raw_value_names:
 		raw_value_names.remove("Time")
 
+	if mode is None:
+		# interp decides whether the data should be linearly interpolated or step interpolated
+		mode = 'linear' if interp else 'step'
+
+	if (delta_t == -1) or (mode != 'step'):
+		index = None
+
 	# Get raw values (not interpolated)
-	raw_data = get_raw_Molly_data(start_time, end_time, raw_value_names)
+	raw_data = get_raw_Molly_data(start_time, end_time, raw_value_names, num_threads, archive, index, value_dtype)
+
+	return process_raw_Molly_data(raw_data, start_time, end_time, value_names, delta_t, mode, value_dtype, time_unit)
+
+def process_raw_Molly_data(raw_data, start_time, end_time, value_names, delta_t, mode, value_dtype = np.float64, time_unit = 's'):
+	'''
+	Second half of get_Molly_data(): shifts the output of get_raw_Molly_data() so that zero corresponds to start_time,
+	and then either trims it (if delta_t == -1) or resamples it onto a grid with time step delta_t.
+	The output has the given value_dtype and time_unit (see get_data()).
+	'''
+
+	raw_value_names = [name for name in value_names if name != "Time"]
 
 	# Shift raw data time so that zero corresponds to start time. 
 	# (Time vectors from get_raw_Molly_data() are in "Molly time", zero is midnight on the first day.)
@@ -172,8 +470,8 @@ def get_Molly_data(start_time, end_time, value_names, delta_t, interp = False):
 
 			inds = (raw_data[name]['time'] >= 0) & (raw_data[name]['time'] <= tot_seconds)
 			data[name] = {
-				'time': raw_data[name]['time'][inds],
-				'vals': raw_data[name]['vals'][inds]
+				'time': convert_time(raw_data[name]['time'][inds], time_unit),
+				'vals': raw_data[name]['vals'][inds].astype(value_dtype, copy = False)
 			}
 
 		return data 
@@ -183,40 +481,310 @@ def get_Molly_data(start_time, end_time, value_names, delta_t, interp = False):
 	# arange excludes the endpoint by default. The 1e-3*delta_t buffer is a "safety" for that
 	time_interp = np.arange(0.0, tot_seconds + 1e-3*delta_t, delta_t)
 
-	data = {}
-	for name in raw_value_names:
+	with prof.stage('Molly resampling'):
+		data = resample_Molly_data(raw_data, time_interp, mode, dtype = value_dtype)
+
+	if "Time" in value_names:
+		data["Time"] = convert_time(time_interp, time_unit)
+
+	return data
+
+def convert_Molly_data(data, value_dtype = np.float64, time_unit = 's'):
+	'''
+	Converts Molly data with float64 values and times in seconds (e.g., the chunks from iter_Molly_data()) to the given value_dtype and time_unit (see get_data()).
+	Handles resampled arrays, raw {'time': ..., 'vals': ...} data, and envelope {'min': ..., 'max': ...} data.
+	'''
+
+	converted = {}
+	for name, vals in data.items():
+		if name == "Time":
+			converted[name] = convert_time(vals, time_unit)
+		elif isinstance(vals, dict) and ('time' in vals):
+			converted[name] = {'time': convert_time(vals['time'], time_unit), 'vals': vals['vals'].astype(value_dtype, copy = False)}
+		elif isinstance(vals, dict):
+			converted[name] = {key: vals[key].astype(value_dtype, copy = False) for key in vals}
+		else:
+			converted[name] = vals.astype(value_dtype, copy = False)
+
+	return converted
+
+resample_modes = ['linear', 'step', 'mean', 'min', 'max', 'last', 'envelope']
+
+def resample_Molly_data(raw_data, time_interp, mode = 'step', bin_width = None, dtype = np.float64):
+	'''
+	Resamples raw Molly data (a dictionary of {'time': ..., 'vals': ...} for each value) onto the shared time grid time_interp.
+	Returns a dictionary with one numpy array (the same length as time_interp) for each value.
+
+	Modes:
+	- 'linear': linear interpolation between the raw values
+	- 'step': the value in force at each time (i.e., the last value Molly recorded at or before that time)
+	- 'mean', 'min', 'max', 'last': statistics over each bin, from time_interp[k] up to time_interp[k+1].
+		'min' and 'max' include the value in force at the start of the bin, since Molly only records changes.
+		'mean' is the mean of the values recorded in the bin, and 'last' is the last value recorded in the bin.
+		If nothing was recorded in a bin, these give the value in force (the same as 'step').
+	- 'envelope': both 'min' and 'max'. Each value in the output is a dictionary {'min': ..., 'max': ...}
+
+	bin_width is the width of the bins. By default it is the spacing of time_interp.
+	dtype is the dtype of the output arrays. (Means are still summed in float64.)
+
+	Values with no data at all give NaN.
+
+	The bin statistics for all values are calculated together, with one numpy reduction over all the data.
+	'''
 
+	if mode not in resample_modes:
+		raise Exception(f'Invalid resampling mode "{mode}". Allowed modes are {resample_modes}')
 
-		if raw_data[name]['vals'].size == 0:
+	if mode == 'envelope':
+		data_min = resample_Molly_data(raw_data, time_interp, 'min', bin_width, dtype)
+		data_max = resample_Molly_data(raw_data, time_interp, 'max', bin_width, dtype)
+		return {name: {'min': data_min[name], 'max': data_max[name]} for name in raw_data}
+
+	num_points = time_interp.size
+
+	# Result for each value is a row of this array
+	out = np.full((len(raw_data), num_points), np.nan, dtype = dtype)
+
+	if num_points == 0:
+		return {name: out[n] for n, name in enumerate(raw_data)}
+
+	if bin_width is not None:
+		bin_end = time_interp[-1] + bin_width
+	elif num_points > 1:
+		bin_end = time_interp[-1] + (time_interp[-1] - time_interp[-2])
+	else:
+		bin_end = np.inf
+
+	bin_inds = []
+	bin_vals = []
+
+	for n, name in enumerate(raw_data):
+		time = raw_data[name]['time']
+		vals = raw_data[name]['vals']
+
+		if vals.size == 0:
 			# If the value was not found, return a list of NaNs.
-			data[name] = np.empty_like(time_interp)
-			data[name][:] = np.nan
+			continue
+
+		# Have to sort the raw data so that the times are monotonically-increasing...
+		# They should be monotonically-increasing anyway, but it seems like rounding error sometimes
+		# screws this up. (Probably happens when the time crosses midnight.)
+		# Checking is much faster than sorting, so only sort when necessary.
+		if np.any(time[1:] < time[:-1]):
+			sort_inds = np.argsort(time, kind = 'stable')
+			time = time[sort_inds]
+			vals = vals[sort_inds]
+
+		if mode == 'linear':
+			out[n] = np.interp(time_interp, time, vals)
+			continue
+
+		# For each time in the interpolated data, find the last time in the raw data that the value was changed.
+		inds = np.searchsorted(time, time_interp, side = 'right') - 1
+
+		if mode == 'step':
+			# (Same as previous versions: times before the first value wrap around to the last value)
+			out[n] = vals[inds]
+			continue
+
+		out[n] = np.where(inds >= 0, vals[np.maximum(inds, 0)], np.nan)
+
+		# Find the bin for each raw value, and discard the values outside all the bins
+		in_range = (time >= time_interp[0]) & (time < bin_end)
+		bins = np.searchsorted(time_interp, time[in_range], side = 'right') - 1
+
+		bin_inds.append(n*num_points + bins)
+		bin_vals.append(vals[in_range])
+
+	if (mode not in ['linear', 'step']) and bin_inds:
+		# Flattened bin indices of all the values are in increasing order, so each bin is a contiguous run
+		bin_inds = np.concatenate(bin_inds)
+		bin_vals = np.concatenate(bin_vals)
+
+		if bin_inds.size > 0:
+			run_starts = np.flatnonzero(np.concatenate([[True], bin_inds[1:] != bin_inds[:-1]]))
+			run_ends = np.concatenate([run_starts[1:], [bin_inds.size]])
+			filled = bin_inds[run_starts]
+
+			out_flat = out.reshape(-1)
+
+			if mode == 'mean':
+				out_flat[filled] = np.add.reduceat(bin_vals, run_starts, dtype = np.float64)/(run_ends - run_starts)
+			elif mode == 'min':
+				out_flat[filled] = np.fmin(out_flat[filled], np.minimum.reduceat(bin_vals, run_starts))
+			elif mode == 'max':
+				out_flat[filled] = np.fmax(out_flat[filled], np.maximum.reduceat(bin_vals, run_starts))
+			elif mode == 'last':
+				out_flat[filled] = bin_vals[run_ends - 1]
+
+	return {name: out[n] for n, name in enumerate(raw_data)}
+
+def iter_Molly_data(start_time, end_time, value_names, delta_t = -1, interp = False, chunk = dt.timedelta(hours = 6), archive = None, mode = None):
+	'''
+	Streaming version of get_Molly_data(). Instead of returning all the data at once, yields one dictionary per chunk of time, in order.
+	Only about one chunk (plus one hour) of data is held in memory at a time, so this can be used to scan through months of data.
+	(Except for linear interpolation, see below.)
+
+	- chunk is a timedelta giving the length of each chunk. (When resampling, it is rounded to a whole number of time steps.)
+	- mode is any of the modes in resample_Molly_data(). If mode is None, it is set by interp.
+	- The other arguments are the same as for get_Molly_data()
+
+	Each yielded dictionary has the same form as the output of get_Molly_data(), but only covers [chunk start, chunk end).
+	(The last chunk also includes end_time.) Times are still relative to start_time.
+
+	If delta_t == -1, each value is a dictionary of raw 'time' and 'vals' arrays, sorted by time.
+	Unlike get_Molly_data(), these don't include events which are read after their chunk was already yielded. Molly hour files can contain
+	carry-forward repeats of earlier values, timed more than an hour before the file (sometimes shifted slightly by float32 rounding).
+	Such events only set the value in force at the start of the next chunk. So the chunks put together can have fewer events than get_Molly_data(delta_t = -1).
+	Otherwise, the values are resampled onto the same time grid as get_Molly_data(), and the last value of each chunk is carried over into the next.
+	Before the first recorded value, step-interpolated data is NaN.
+
+	Linear interpolation (interp = True) needs the next change after the end of each chunk. So hour files are read past the end of the chunk
+	until every value has changed (or end_time is reached), and only that extra data is held over for the next chunk.
+	The output is then the same as get_Molly_data(), but values which rarely change can make this read (and hold) many hours ahead.
+	(The other modes only depend on the data up to the end of each chunk.)
+	'''
+
+	raw_value_names = [name for name in value_names if name != "Time"]
+
+	if mode is None:
+		mode = 'linear' if interp else 'step'
+
+	delta = dt.timedelta(hours=1)
+
+	tot_seconds = (end_time - start_time).total_seconds()
+	chunk_seconds = chunk.total_seconds()
 
+	if chunk_seconds <= 0:
+		raise Exception("chunk must be positive")
+
+	# Molly time is relative to midnight on the day of each file. Convert everything to time relative to start_time.
+	start_day = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+	start_offset = (start_time - start_day).total_seconds()
+
+	# As in get_raw_Molly_data(), start with the previous hour and end with the following hour to be safe.
+	next_hour = start_time.replace(minute=0, second=0, microsecond=0) - delta
+	last_hour = end_time + delta
+
+	if delta_t != -1:
+		# Same grid as get_Molly_data(): np.arange(0.0, tot_seconds + 1e-3*delta_t, delta_t)
+		num_points = int(np.ceil((tot_seconds + 1e-3*delta_t)/delta_t))
+
+		# Chunks start and end on grid points, so that no bin is split between chunks (see resample_Molly_data())
+		points_per_chunk = max(int(round(chunk_seconds/delta_t)), 1)
+
+	# Data read but not yet yielded, and the last value before the current chunk
+	buffer = {name: (np.zeros(0), np.zeros(0)) for name in raw_value_names}
+	carry = {name: None for name in raw_value_names}
+
+	chunk_start = 0.0
+	k_start = 0
+	while True:
+
+		if delta_t == -1:
+			chunk_end = min(chunk_start + chunk_seconds, tot_seconds)
+			last_chunk = (chunk_end >= tot_seconds)
 		else:
-			# interp decides whether the data should be linearly interpolated or step interpolated
-			if interp:
-				data[name] = np.interp(time_interp, raw_data[name]['time'], raw_data[name]['vals'])
-			else: 
-				# Have to sort the raw data so that the times are monotonically-increasing...
-				# They should be monotonically-increasing anyway, but it seems like rounding error sometimes
-				# screws this up. (Probably happens when the time crosses midnight.)
-				sort_inds = np.argsort(raw_data[name]['time'])
-				raw_data[name]['time'] = raw_data[name]['time'][sort_inds]
-				raw_data[name]['vals'] = raw_data[name]['vals'][sort_inds]
-
-				# Now, for each time in the interpolated data, find the last time in the raw data that the
-				# value was changed, and use the corresponding value.
-				inds = np.digitize(time_interp, raw_data[name]['time']) - 1
-				data[name] = raw_data[name]['vals'][inds]
-
-			
+			k_end = min(k_start + points_per_chunk, num_points)
+			last_chunk = (k_end >= num_points)
+			chunk_end = tot_seconds if last_chunk else k_end*delta_t
 
-	if "Time" in value_names:
-		data["Time"] = time_interp
+			time_interp = np.arange(k_start, k_end)*delta_t
 
-	return data
+		# Read all the hour files which could contain data up to the end of the chunk
+		while next_hour <= last_hour:
+
+			if next_hour > start_time + dt.timedelta(seconds = chunk_end) + delta:
+				# Linear interpolation also needs the next change after the chunk, for every value
+				if (delta_t == -1) or (mode != 'linear'):
+					break
+				if all((buffer[name][0].size > 0) and (np.max(buffer[name][0]) > chunk_end) for name in raw_value_names):
+					break
+
+			if archive is not None:
+				data_hour = archive.get_raw_Molly_data_hour(next_hour, raw_value_names)
+			else:
+				data_hour = get_raw_Molly_data_hour(next_hour, raw_value_names)
+
+			num_days = (next_hour.replace(hour=0, minute=0, second=0, microsecond=0) - start_day).days
+
+			for name in raw_value_names:
+				time, vals = buffer[name]
+				buffer[name] = (
+					np.concatenate([time, data_hour[name]['time'] + (num_days*86400 - start_offset)]),
+					np.concatenate([vals, data_hour[name]['vals']])
+				)
 
-def get_raw_Molly_data_hour(import_time, value_names):
+			next_hour += delta
+
+		data = {}
+		known = {}
+		for name in raw_value_names:
+			time, vals = buffer[name]
+
+			# Should already be sorted, but files can overlap slightly (see get_Molly_data())
+			if np.any(time[1:] < time[:-1]):
+				sort_inds = np.argsort(time, kind = 'stable')
+				time = time[sort_inds]
+				vals = vals[sort_inds]
+
+			i_start = np.searchsorted(time, chunk_start, side = 'left')
+			i_end = np.searchsorted(time, chunk_end, side = 'right' if last_chunk else 'left')
+
+			# Data from before the chunk (e.g., the extra hour at the start) only sets the initial value
+			if (i_start > 0) and ((carry[name] is None) or (time[i_start-1] >= carry[name][0])):
+				carry[name] = (time[i_start-1], vals[i_start-1])
+
+			if delta_t == -1:
+				data[name] = {
+					'time': time[i_start:i_end],
+					'vals': vals[i_start:i_end]
+				}
+			else:
+				# Everything known from the start of the chunk onwards (including the value in force at the start)
+				if carry[name] is None:
+					known[name] = {'time': time[i_start:], 'vals': vals[i_start:]}
+				else:
+					known[name] = {
+						'time': np.concatenate([[carry[name][0]], time[i_start:]]),
+						'vals': np.concatenate([[carry[name][1]], vals[i_start:]])
+					}
+
+			if i_end > i_start:
+				carry[name] = (time[i_end-1], vals[i_end-1])
+
+			buffer[name] = (time[i_end:], vals[i_end:])
+
+		if delta_t != -1:
+			resample_start = tm.perf_counter()
+
+			if mode == 'step':
+				for name in raw_value_names:
+					if known[name]['time'].size == 0:
+						data[name] = np.full(time_interp.size, np.nan)
+						continue
+
+					inds = np.searchsorted(known[name]['time'], time_interp, side = 'right') - 1
+					data[name] = np.where(inds >= 0, known[name]['vals'][np.maximum(inds, 0)], np.nan)
+			else:
+				data = resample_Molly_data(known, time_interp, mode, bin_width = delta_t)
+
+			if prof.current_profile is not None:
+				prof.current_profile.add_time('Molly resampling', tm.perf_counter() - resample_start)
+
+			if "Time" in value_names:
+				data["Time"] = time_interp
+
+		yield data
+
+		if last_chunk:
+			break
+
+		chunk_start = chunk_end
+		if delta_t != -1:
+			k_start = k_end
+
+def get_raw_Molly_data_hour(import_time, value_names, use_mmap = False):
 	'''
 	Converts the binary Molly data files into numpy arrays.
 
@@ -236,13 +804,19 @@ def get_raw_Molly_data_hour(import_time, value_names):
 	This function does that for a single hour chunk, outputting a dictionary.
 	The dictionary contains one entry for each value requested.
 	Each entry of the output dictionary is itself a dictionary with two keys: "val" and "time", corresponding to the time and value sequence in the Molly data.
+
+	If use_mmap == True, the binary file is memory-mapped rather than read, and each entry of the output dictionary is a MollyValueView instead.
+	This avoids copying the data, which helps when holding many signals over long periods in memory.
 	'''
 
 	header_path, binary_path = get_filepaths(import_time)
 
 	total_values, values_offset = get_line_numbers(header_path, value_names)
 
-	data_hour = get_data_from_binary(binary_path, total_values, values_offset, value_names)
+	if use_mmap:
+		data_hour = get_data_from_binary_mmap(binary_path, total_values, values_offset, value_names)
+	else:
+		data_hour = get_data_from_binary(binary_path, total_values, values_offset, value_names)
 
 	return data_hour
 
@@ -252,7 +826,7 @@ def get_filepaths(import_time):
 
 	Mostly used in get_raw_Molly_data_hour()
 	'''
-	path = r"\\insitu1.nexus.uwaterloo.ca\Documents\QNC MBE Data\Production Data\Molly data"
+	path = os.path.join(production_data_path, "Molly data")
 	year = str(import_time.year)
 	month = str(import_time.month)
 	day = str(import_time.day)
@@ -268,48 +842,220 @@ def get_filepaths(import_time):
 
 	return header_path, binary_path
 
-def get_line_numbers(header_path, value_names):
+# Matches one value entry in a Molly header file. Groups are the name, TotalValues and ValueOffset
+header_line_regex = re.compile(r"^DataItem=Name:(.*?);.*?TotalValues:([0-9]+);ValueOffset:([0-9]+)\s*$")
+
+def parse_header(header_path):
 	'''
-	Searches the header file for the given value_names and returns their location and size in the binary file.
+	Reads a Molly header file once and returns a dictionary of every value in it: {name: (total_values, values_offset)}
 
-	The output is used in get_data_from_binary(), and mostly used in get_raw_Molly_data_hour()
+	This can be reused to look up several sets of value names from the same hour (see get_line_numbers()).
+	Raises IOError if the header file can't be opened.
 	'''
 
-	try:
-		header = open(header_path, "r")
-	except IOError:
-		print("Warning: missing header file " + header_path)
-		return -1, -1
-
-	try: 
-		total_values = {}
-		values_offset = {}
-		found = {}
-		regex = {}
-		for name in value_names:
-			total_values[name] = 0
-			values_offset[name] = 0
-			found[name] = False
-			regex[name] = re.compile(r"^DataItem=Name:" + name + ".*?" + "TotalValues:([0-9].*?);ValueOffset:([0-9].*?)\s*?\n")
+	header_index = {}
+
+	with open(header_path, "r") as header, prof.stage('Molly header parse'):
+		prof.count('Molly header files read')
+		prof.add_bytes('Molly', os.fstat(header.fileno()).st_size)
 
 		for line in header:
-			for name in value_names:
-				if name in line: # (Redundant, but increases speed)
-					match = regex[name].search(line)
-					if (match):
-						total_values[name] = int(match.group(1))
-						values_offset[name] = int(match.group(2))
-						if found[name]:
-							print("Warning: duplicate entries for '" + name + "'.")
-						else:
-							found[name] = True
+			if not line.startswith("DataItem=Name:"): # (Redundant, but increases speed)
+				continue
 
-		for name in value_names:
-			if not found[name]:
-				print("Warning: could not find value '" + name + "'")
+			match = header_line_regex.search(line)
+			if match:
+				name = match.group(1)
+				if name in header_index:
+					print("Warning: duplicate entries for '" + name + "'.")
 
-	finally:
-		header.close()
+				header_index[name] = (int(match.group(2)), int(match.group(3)))
+
+	return header_index
+
+def get_file_key(file_path):
+	'''
+	Returns (size, modification time) of a file, which cached data parsed from it is checked against.
+	Raises IOError (OSError) if the file doesn't exist.
+	'''
+
+	stat = os.stat(file_path)
+	return (stat.st_size, stat.st_mtime_ns)
+
+def replace_file(file_path, write):
+	'''
+	Creates (or replaces) file_path by calling write(tmp_path), creating its directory if necessary.
+	The file is written under a temporary name first, so that other processes never see a partially-written file.
+	tmp_path keeps the extension of file_path (np.savez() would add one otherwise).
+	'''
+
+	os.makedirs(os.path.dirname(file_path), exist_ok = True)
+
+	root, ext = os.path.splitext(file_path)
+	tmp_path = '{}.{}-{}.tmp{}'.format(root, os.getpid(), threading.get_ident(), ext)
+	write(tmp_path)
+	os.replace(tmp_path, file_path)
+
+class FileCache():
+	'''
+	Base class for caches of data parsed from files (see HeaderIndexCache and ParsedFileCache).
+
+	Entries are keyed on the file path and the arguments of parse(), and are only reused if the file size and modification time still match (see get_file_key()).
+	At most max_entries are kept in memory, discarding the least recently used first.
+	If cache_dir is set, entries are also saved there, so they persist between sessions.
+
+	Subclasses define:
+	- name: used in the profiling counts ('<name> cache hits' and '<name> disk cache hits')
+	- extension: of the files saved in cache_dir
+	- parse(file_path, *args): reads the file
+	- load_from_disk(disk_path, entry_key, key): returns the saved data, or None if it is missing or out of date
+	- save_to_disk(disk_path, entry_key, key, data)
+	'''
+
+	name = 'file'
+	extension = '.json'
+
+	def __init__(self, max_entries = 1000, cache_dir = None):
+		self.max_entries = max_entries
+		self.cache_dir = cache_dir
+
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, file_path, *args):
+		'''
+		Returns parse(file_path, *args), reading the file only if necessary.
+		Raises IOError (OSError) if the file doesn't exist.
+		'''
+
+		key, data = self.lookup(file_path, *args)
+		if data is None:
+			data = self.parse(file_path, *args)
+			self.store(key, data, file_path, *args)
+
+		return data
+
+	def lookup(self, file_path, *args):
+		'''
+		Returns (key, data), where key is the current get_file_key(file_path), and data is the cached parse(file_path, *args) (from memory or cache_dir), or None if there is none.
+		'''
+
+		key = get_file_key(file_path)
+		entry_key = (file_path,) + args
+
+		with self.lock:
+			entry = self.entries.get(entry_key)
+			if entry is not None and entry[0] == key:
+				self.entries.move_to_end(entry_key)
+				prof.count(self.name + ' cache hits')
+				return key, entry[1]
+
+		if self.cache_dir is None:
+			return key, None
+
+		data = self.load_from_disk(self.get_disk_path(entry_key), entry_key, key)
+		if data is not None:
+			prof.count(self.name + ' disk cache hits')
+			self.store(key, data, file_path, *args, save = False)
+
+		return key, data
+
+	def store(self, key, data, file_path, *args, save = True):
+		'''
+		Caches data as parse(file_path, *args), for the file key returned by lookup(). If save is True, it is also saved in cache_dir.
+		'''
+
+		entry_key = (file_path,) + args
+
+		with self.lock:
+			self.entries[entry_key] = (key, data)
+			self.entries.move_to_end(entry_key)
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last = False)
+
+		if save and (self.cache_dir is not None):
+			replace_file(self.get_disk_path(entry_key), lambda tmp_path: self.save_to_disk(tmp_path, entry_key, key, data))
+
+	def get_disk_path(self, entry_key):
+		file_name = hashlib.sha1(repr(entry_key).encode('utf8')).hexdigest() + self.extension
+		return os.path.join(self.cache_dir, file_name)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+class HeaderIndexCache(FileCache):
+	'''
+	Cache of parsed Molly header files (see parse_header()), so that the same hour doesn't have to be re-read from the server.
+	At most max_entries headers are kept in memory. If cache_dir is set, they are also saved there (as small .json files), see FileCache.
+	'''
+
+	name = 'header'
+	extension = '.json'
+
+	def parse(self, header_path):
+		return parse_header(header_path)
+
+	def load_from_disk(self, disk_path, entry_key, key):
+		try:
+			with open(disk_path, 'r') as f:
+				saved = json.load(f)
+		except (IOError, ValueError):
+			return None
+
+		if (saved['path'] != entry_key[0]) or (tuple(saved['key']) != key):
+			return None
+
+		return {name: tuple(entry) for name, entry in saved['index'].items()}
+
+	def save_to_disk(self, disk_path, entry_key, key, header_index):
+		with open(disk_path, 'w') as f:
+			json.dump({'path': entry_key[0], 'key': key, 'index': header_index}, f)
+
+header_index_cache = HeaderIndexCache()
+
+def set_cache_dir(cache_dir):
+	'''
+	Sets the local directory used to save caches between sessions (e.g., parsed Molly headers, the BET/ISP and SVT file catalogs, and parsed BET/ISP and SVT files).
+	If cache_dir is None, caches are only kept in memory.
+	'''
+
+	if cache_dir is None:
+		header_index_cache.cache_dir = None
+		file_catalog.cache_dir = None
+		parsed_file_cache.cache_dir = None
+	else:
+		header_index_cache.cache_dir = os.path.join(cache_dir, 'Molly headers')
+		file_catalog.cache_dir = os.path.join(cache_dir, 'File catalogs')
+		parsed_file_cache.cache_dir = os.path.join(cache_dir, 'Parsed files')
+
+def get_line_numbers(header_path, value_names, header_index = None):
+	'''
+	Searches the header file for the given value_names and returns their location and size in the binary file.
+
+	The output is used in get_data_from_binary(), and mostly used in get_raw_Molly_data_hour()
+
+	header_index can be given (from parse_header()) to avoid re-reading the header file.
+	Otherwise, it is taken from header_index_cache, which only re-reads the file if it has changed.
+	'''
+
+	if header_index is None:
+		try:
+			header_index = header_index_cache.get(header_path)
+		except IOError:
+			print("Warning: missing header file " + header_path)
+			prof.count('Molly header files missing')
+			return -1, -1
+
+	total_values = {}
+	values_offset = {}
+	for name in value_names:
+		if name in header_index:
+			total_values[name], values_offset[name] = header_index[name]
+		else:
+			print("Warning: could not find value '" + name + "'")
+			total_values[name] = 0
+			values_offset[name] = 0
 
 	return total_values, values_offset
 
@@ -325,11 +1071,14 @@ def get_data_from_binary(binary_path, total_values, values_offset, value_names):
 		binary = open(binary_path, "rb")
 	except IOError:
 		print("Warning: missing binary file " + binary_path)
+		prof.count('Molly binary files missing')
 		data = {}
 		for name in value_names:
 			data[name] = {"time": np.zeros(0), "vals": np.zeros(0)}
 		return data
 
+	prof.count('Molly binary files opened')
+
 	try:
 
 		data = {}
@@ -339,54 +1088,832 @@ def get_data_from_binary(binary_path, total_values, values_offset, value_names):
 				data[name] = {"time": np.zeros(0), "vals": np.zeros(0)}
 				break
 
-			data[name] = {"time": np.zeros(total_values[name]), "vals": np.zeros(total_values[name])}
-
-			binary.seek((values_offset[name]+1)*8)
-			for n in range(total_values[name]):
-				data[name]["time"][n] = struct.unpack('f', binary.read(4))[0]*86400
-				data[name]["vals"][n] = struct.unpack('f', binary.read(4))[0]
+			time, vals = read_Molly_block(binary, total_values[name], values_offset[name])
+			data[name] = {"time": time, "vals": vals}
 
 	finally:
 		binary.close()
 
 	return data
 
+def read_Molly_block(binary, total_values, values_offset):
+	'''
+	Reads the data for a single value from an open Molly binary file, returning (time, vals) numpy arrays.
 
-#def import_to_csv(start_time, end_time, value_names, delta_t, file_name, delimiter = '\t'):
-def import_to_csv(value_names, data, file_name, delimiter = ','):
- 
-	#data = get_Molly_data(start_time, end_time, value_names, delta_t)
+	The data for each value is a contiguous block of (time, value) pairs of float32, starting at (values_offset+1)*8 bytes.
+	(Time is stored in days relative to midnight, and is converted to seconds here.)
+	The whole block is read in one call and decoded with numpy, rather than unpacking each pair individually.
+
+	If the file is truncated, only the complete pairs are returned.
+	'''
+
+	with prof.stage('Molly binary read'):
+		binary.seek((values_offset+1)*8)
+		block = binary.read(total_values*8)
+
+	prof.add_bytes('Molly', len(block))
+
+	pairs = np.frombuffer(block, dtype=np.float32, count=len(block)//8*2).reshape(-1, 2)
+
+	# Upcast before scaling, so that the result matches float(struct.unpack('f', ...)[0])*86400 exactly
+	time = pairs[:,0].astype(np.float64)*86400
+	vals = pairs[:,1].astype(np.float64)
+
+	return time, vals
+
+class MollyValueView():
+	'''
+	Zero-copy view of the data for a single value in a memory-mapped Molly binary file. Returned by get_data_from_binary_mmap()
 
-	out_file = open(file_name, 'wb')
+	self.pairs is the raw (N, 2) float32 array of (time, value) pairs, exactly as stored by Molly. (Time is in days relative to midnight.)
+	Nothing is converted until the 'time' or 'vals' attributes are accessed:
+	- 'time' is a new float64 array in seconds relative to midnight (same as get_data_from_binary())
+	- 'vals' is a float32 view of the values (no copy)
+
+	Can also be indexed like the dictionaries returned by get_data_from_binary(), i.e., view['time'] and view['vals'].
+	'''
+
+	def __init__(self, pairs):
+		self.pairs = pairs
+
+	@property
+	def time(self):
+		return self.pairs[:,0].astype(np.float64)*86400
+
+	@property
+	def vals(self):
+		return self.pairs[:,1]
+
+	def __getitem__(self, key):
+		if key not in ('time', 'vals'):
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def __len__(self):
+		return self.pairs.shape[0]
+
+def get_data_from_binary_mmap(binary_path, total_values, values_offset, value_names):
+	'''
+	Same as get_data_from_binary(), but memory-maps the binary file and returns a MollyValueView for each value instead of copying the data.
+
+	The file stays mapped for as long as any of the returned views are alive.
+	'''
+
+	empty = np.zeros((0, 2), dtype=np.float32)
+
+	if total_values == -1:
+		# Header file was missing (see get_line_numbers())
+		return {name: MollyValueView(empty) for name in value_names}
 
 	try:
-		header_str = ""
-		for name in value_names:
-			header_str += name + delimiter
-		# Replace last delimiter with newline
-		header_str = header_str[:-len(delimiter)] + '\n'
+		binary = np.memmap(binary_path, dtype=np.float32, mode='r')
+	except IOError:
+		print("Warning: missing binary file " + binary_path)
+		prof.count('Molly binary files missing')
+		return {name: MollyValueView(empty) for name in value_names}
+	except ValueError:
+		# mmap raises ValueError for empty files
+		print("Warning: empty binary file " + binary_path)
+		return {name: MollyValueView(empty) for name in value_names}
 
-		out_file.write(bytes(header_str, 'utf8'))
+	prof.count('Molly binary files opened')
 
+	data = {}
+	for name in value_names:
+		if (total_values[name] < 0) or (values_offset[name] < 0):
+			print("Warning: Invalid total_values or values_offset for " + name)
+			data[name] = MollyValueView(empty)
+			continue
 
-		out_data = np.zeros((len(data[next(iter(data))]), len(value_names)))
-		for ind, name in enumerate(value_names):
-			out_data[:,ind] = data[name]
+		start = (values_offset[name]+1)*2
+		block = binary[start:start + total_values[name]*2]
 
-		np.savetxt(out_file, out_data, delimiter = delimiter, fmt = '%.8g')
+		# Drop any incomplete pair at the end of a truncated file
+		block = block[:block.size//2*2]
 
-	finally:
-		out_file.close()
+		data[name] = MollyValueView(block.reshape(-1, 2))
+
+		# (Mapped, rather than read. The pages are only read from disk when the data is used.)
+		prof.add_bytes('Molly', block.nbytes)
+
+	return data
+
+
+def get_file_times(file_path):
+	'''
+	Returns the (creation time, modification time) of a file as datetime objects.
+
+	BET and SVT data files are timed relative to when the file was created, so these are needed to interpret the data.
+	If the file is listed in file_times (e.g., a local copy of a server file), the original times are returned.
+	'''
+
+	times = file_times.get(os.path.normpath(file_path))
+
+	if times is None:
+		times = (os.path.getctime(file_path), os.path.getmtime(file_path))
+
+	return dt.datetime.fromtimestamp(times[0]), dt.datetime.fromtimestamp(times[1])
+
+def load_file_times(root_dir):
+	'''
+	Adds the original file times listed in root_dir/file_times.json to file_times.
+
+	file_times.json should contain {relative path: {'ctime': timestamp, 'mtime': timestamp, ...}}, with paths relative to root_dir.
+	'''
+
+	with open(os.path.join(root_dir, 'file_times.json'), 'r') as f:
+		saved = json.load(f)
+
+	for rel_path, entry in saved.items():
+		file_times[os.path.normpath(os.path.join(root_dir, rel_path))] = (entry['ctime'], entry['mtime'])
+
+class FileCatalog():
+	'''
+	Catalog of the data files in each directory (e.g., BET data, ISP data), with their creation and modification times (see get_file_times()).
+
+	Without the catalog, every query has to list the directory and check the times of every file in it over the network,
+	just to find the few files which overlap the query. The catalog keeps the files of each directory sorted by creation time,
+	so the overlapping files are found with a binary search instead.
+
+	A directory is only listed again when its modification time changes (i.e., files were added, removed, or renamed),
+	and then only the new files are checked. The file with the latest creation time is the one which may still be written to
+	(which doesn't change the directory modification time), so its times are checked again on every query.
+
+	Whole directory trees (e.g., the SVT logs, in one directory per growth) are cataloged the same way, see get_tree_files().
+
+	If cache_dir is set, the catalog is also saved there (as one .json file per directory or tree), so it persists between sessions.
+	'''
+
+	def __init__(self, cache_dir = None, time_margin = 600):
+		'''
+		- cache_dir is the local directory where the catalog is saved (None to only keep it in memory)
+		- time_margin is the allowed difference, in seconds, between the clocks of the computer writing the files and this computer.
+			Files modified within time_margin of the last check of a tree are checked again, as well as the newest files (see get_tree_files()).
+		'''
+
+		self.cache_dir = cache_dir
+		self.time_margin = time_margin
+
+		self.dirs = {}
+		self.trees = {}
+
+		# One lock for each directory or tree, so that different directories (e.g., BET and SVT, with get_data(parallel = True)) are listed at the same time.
+		# self.lock only protects path_locks.
+		self.lock = threading.Lock()
+		self.path_locks = {}
+
+	def get_files(self, dir_path, start_time, end_time, prefix = '', suffix = ''):
+		'''
+		Returns a list of (file path, creation time, modification time) for the files in dir_path which were being written between start_time and end_time
+		(i.e., creation time < end_time and modification time > start_time), sorted by creation time.
+		Only file names starting with prefix and ending with suffix are included.
+		'''
+
+		with self.get_path_lock('dir', dir_path):
+			entry = self.refresh(dir_path)
+
+		return self.find_files(dir_path, entry, start_time, end_time, prefix, suffix)
+
+	def get_tree_files(self, root_path, start_time, end_time, prefix = '', suffix = '', log_suffixes = None):
+		'''
+		Same as get_files(), but for all the files in root_path and all of its subdirectories.
+
+		Listing a whole tree takes one request per directory, so on each query only the directories which changed since the last query are listed again
+		(plus directories containing other directories, since changes further down don't change their modification time).
+
+		Writing to a file doesn't change the modification time of its directory, so files which may still be growing are checked again on every query:
+		the newest file (by creation time) ending with each of log_suffixes (e.g., one for each SVT log, see get_SVT_data()),
+		or only the newest file in the tree if log_suffixes is None, and any file which was still being written at the last check (within time_margin).
+
+		(The query times can't be used to skip the check: files with old creation times can still be added later, e.g., copied logs, or a DataSync mirror.)
+		'''
+
+		with self.get_path_lock('tree', root_path):
+			entry = self.refresh_tree(root_path, log_suffixes)
+
+		return self.find_files(root_path, entry, start_time, end_time, prefix, suffix)
+
+	def get_path_lock(self, kind, path):
+		with self.lock:
+			return self.path_locks.setdefault((kind, path), threading.Lock())
+
+	def find_files(self, dir_path, entry, start_time, end_time, prefix = '', suffix = ''):
+		'''
+		Binary search of a catalog entry for the files overlapping start_time to end_time (see get_files())
+		'''
+
+		start = start_time.timestamp()
+		end = end_time.timestamp()
+
+		# Files created before end_time
+		i_end = np.searchsorted(entry['ctimes'], end, side = 'left')
+
+		# max_mtimes is the latest modification time so far (in order of creation time), so it is sorted.
+		# Every file before i_start was last modified before start_time.
+		i_start = np.searchsorted(entry['max_mtimes'], start, side = 'right')
+
+		files = []
+		for ind in range(i_start, i_end):
+			name = entry['names'][ind]
+			if (entry['mtimes'][ind] > start) and os.path.basename(name).startswith(prefix) and name.endswith(suffix):
+				files.append((os.path.join(dir_path, name), dt.datetime.fromtimestamp(entry['ctimes'][ind]), dt.datetime.fromtimestamp(entry['mtimes'][ind])))
+
+		return files
+
+	def refresh(self, dir_path):
+		'''
+		Brings the catalog of dir_path up to date, and returns it. (Should be called with the lock for dir_path held, see get_path_lock().)
+		'''
+
+		dir_mtime = os.stat(dir_path).st_mtime_ns
+
+		entry = self.dirs.get(dir_path)
+		if entry is None:
+			saved = self.load_from_disk(dir_path)
+			if saved is not None:
+				entry = self.make_entry({name: tuple(times) for name, times in saved['files'].items()})
+				entry['dir_mtime'] = saved['dir_mtime']
+
+		if (entry is not None) and (entry['dir_mtime'] == dir_mtime):
+			prof.count('file catalog hits')
+
+			# The newest file may still be growing
+			if entry['names']:
+				newest = entry['names'][-1]
+				ctime, mtime = get_file_times(os.path.join(dir_path, newest))
+				if mtime.timestamp() != entry['mtimes'][-1]:
+					entry['files'][newest] = (ctime.timestamp(), mtime.timestamp())
+					entry = dict(self.make_entry(entry['files']), dir_mtime = dir_mtime)
+
+			# (The entry may have just been loaded from disk)
+			self.dirs[dir_path] = entry
+
+			return entry
+
+		old_files = {} if entry is None else entry['files']
+
+		with prof.stage('file catalog listing'):
+			files = {}
+			for file_name in os.listdir(dir_path):
+				if file_name in old_files:
+					files[file_name] = old_files[file_name]
+				else:
+					ctime, mtime = get_file_times(os.path.join(dir_path, file_name))
+					files[file_name] = (ctime.timestamp(), mtime.timestamp())
+					prof.count('file catalog files checked')
+
+			# The previously newest file may have been written to since
+			if entry is not None and entry['names'] and (entry['names'][-1] in files):
+				ctime, mtime = get_file_times(os.path.join(dir_path, entry['names'][-1]))
+				files[entry['names'][-1]] = (ctime.timestamp(), mtime.timestamp())
+
+		entry = dict(self.make_entry(files), dir_mtime = dir_mtime)
+		self.dirs[dir_path] = entry
+		self.save_to_disk(dir_path, {'path': dir_path, 'dir_mtime': dir_mtime, 'files': files})
+
+		return entry
+
+	def refresh_tree(self, root_path, log_suffixes = None):
+		'''
+		Brings the catalog of the tree under root_path up to date, and returns it. (Should be called with the lock for root_path held, see get_path_lock().)
+		See get_tree_files()
+		'''
+
+		entry = self.trees.get(root_path)
+		if entry is None:
+			saved = self.load_from_disk(root_path, kind = 'tree')
+			if saved is not None:
+				entry = self.make_tree_entry(saved['dirs'], saved['checked'])
+
+		checked = tm.time()
+		old_dirs = {} if entry is None else entry['dirs']
+
+		with prof.stage('file catalog listing'):
+			dirs = {}
+			changed = self.scan_tree_dir(root_path, '', os.stat(root_path).st_mtime_ns, old_dirs, dirs)
+
+			# The newest log of each kind, and files which were still being written at the last check, may have grown since
+			if entry is not None:
+				newest = {}
+				growing = []
+				for rel_dir, dir_entry in dirs.items():
+					for file_name, times in dir_entry['files'].items():
+						if times[1] >= entry['checked'] - self.time_margin:
+							growing.append((rel_dir, file_name))
+
+						for log_suffix in ([''] if log_suffixes is None else log_suffixes):
+							if file_name.endswith(log_suffix) and ((log_suffix not in newest) or (times[0] > newest[log_suffix][0])):
+								newest[log_suffix] = (times[0], rel_dir, file_name)
+
+				for rel_dir, file_name in set(growing) | {(rel_dir, file_name) for _, rel_dir, file_name in newest.values()}:
+					times = dirs[rel_dir]['files'][file_name]
+					ctime, mtime = get_file_times(os.path.join(root_path, rel_dir, file_name))
+					if (ctime.timestamp(), mtime.timestamp()) != tuple(times):
+						dirs[rel_dir]['files'][file_name] = (ctime.timestamp(), mtime.timestamp())
+						changed = True
+
+		if not changed:
+			prof.count('file catalog hits')
+			self.trees[root_path] = entry
+
+			# Files modified within time_margin of 'checked' are checked again, so it can lag behind by up to time_margin.
+			# This avoids saving the catalog on every query.
+			if checked - entry['checked'] > self.time_margin:
+				entry['checked'] = checked
+				self.save_to_disk(root_path, {'path': root_path, 'checked': checked, 'dirs': entry['dirs']}, kind = 'tree')
+
+			return entry
+
+		entry = self.make_tree_entry(dirs, checked)
+		self.trees[root_path] = entry
+		self.save_to_disk(root_path, {'path': root_path, 'checked': checked, 'dirs': dirs}, kind = 'tree')
+
+		return entry
+
+	def scan_tree_dir(self, root_path, rel_dir, dir_mtime, old_dirs, dirs):
+		'''
+		Adds the catalog of root_path/rel_dir and its subdirectories to dirs, as {relative directory: {'mtime': ..., 'subdirs': ..., 'files': {file name: (ctime, mtime)}}}.
+		Directories are only listed again if they changed since old_dirs, or if they contain other directories.
+		Returns True if anything changed since old_dirs.
+		'''
+
+		old = old_dirs.get(rel_dir)
+		if (old is not None) and (old['mtime'] == dir_mtime) and not old['subdirs']:
+			dirs[rel_dir] = old
+			return False
+
+		old_files = {} if old is None else old['files']
+
+		files = {}
+		subdirs = []
+		with os.scandir(os.path.join(root_path, rel_dir)) as dir_entries:
+			for dir_entry in dir_entries:
+				if dir_entry.is_dir():
+					subdirs.append((os.path.join(rel_dir, dir_entry.name), dir_entry.stat().st_mtime_ns))
+				elif dir_entry.name in old_files:
+					files[dir_entry.name] = old_files[dir_entry.name]
+				else:
+					ctime, mtime = get_file_times(dir_entry.path)
+					files[dir_entry.name] = (ctime.timestamp(), mtime.timestamp())
+					prof.count('file catalog files checked')
+
+		dirs[rel_dir] = {'mtime': dir_mtime, 'subdirs': bool(subdirs), 'files': files}
+
+		changed = (old is None) or (old['mtime'] != dir_mtime) or (files.keys() != old_files.keys())
+
+		for rel_subdir, subdir_mtime in subdirs:
+			changed = self.scan_tree_dir(root_path, rel_subdir, subdir_mtime, old_dirs, dirs) or changed
+
+		return changed
+
+	def make_entry(self, files):
+		'''
+		Sorts files ({file name: (ctime, mtime)}, as timestamps) by creation time into a catalog entry
+		'''
+
+		names = sorted(files, key = lambda name: files[name][0])
+
+		ctimes = np.array([files[name][0] for name in names], dtype = np.float64)
+		mtimes = np.array([files[name][1] for name in names], dtype = np.float64)
+
+		return {
+			'files': files,
+			'names': names,
+			'ctimes': ctimes,
+			'mtimes': mtimes,
+			'max_mtimes': np.maximum.accumulate(mtimes) if mtimes.size else mtimes
+		}
+
+	def make_tree_entry(self, dirs, checked):
+		'''
+		Catalog entry for a whole tree, with the files named by their path relative to the root
+		'''
+
+		files = {}
+		for rel_dir, dir_entry in dirs.items():
+			for file_name, times in dir_entry['files'].items():
+				files[os.path.join(rel_dir, file_name)] = tuple(times)
+
+		return dict(self.make_entry(files), dirs = dirs, checked = checked)
+
+	def get_disk_path(self, dir_path, kind = 'dir'):
+		file_name = hashlib.sha1(dir_path.encode('utf8')).hexdigest() + '-' + kind + '.json'
+		return os.path.join(self.cache_dir, file_name)
+
+	def load_from_disk(self, dir_path, kind = 'dir'):
+		if self.cache_dir is None:
+			return None
+
+		try:
+			with open(self.get_disk_path(dir_path, kind), 'r') as f:
+				saved = json.load(f)
+		except (IOError, ValueError):
+			return None
+
+		if saved['path'] != dir_path:
+			return None
+
+		return saved
+
+	def save_to_disk(self, dir_path, saved, kind = 'dir'):
+		if self.cache_dir is None:
+			return
+
+		def write(tmp_path):
+			with open(tmp_path, 'w') as f:
+				json.dump(saved, f)
+
+		replace_file(self.get_disk_path(dir_path, kind), write)
+
+	def clear(self):
+		self.dirs.clear()
+		self.trees.clear()
+
+file_catalog = FileCatalog()
+
+class ParsedFileCache(FileCache):
+	'''
+	Cache of parsed BET/ISP and SVT text logs (see parse_text_file()), so that the same files aren't parsed again on every query.
+	(So the file which is still being written is parsed again whenever it changes, and the others are only parsed once.)
+	At most max_entries files are kept in memory. If cache_dir is set, they are also saved there as binary sidecar files (.npz), see FileCache.
+	'''
+
+	name = 'parsed file'
+	extension = '.npz'
+
+	def __init__(self, max_entries = 64, cache_dir = None):
+		super().__init__(max_entries, cache_dir)
+
+	def get(self, file_path, skip_lines, usecols, source):
+		'''
+		Returns a copy of parse_text_file(file_path, skip_lines, usecols), reading the file only if necessary.
+		source ('BET' or 'SVT') is only used for profiling.
+		'''
+
+		return super().get(file_path, skip_lines, tuple(usecols), source).copy()
+
+	def parse(self, file_path, skip_lines, usecols, source):
+		data = parse_text_file(file_path, skip_lines, usecols)
+		prof.add_file(source, file_path)
+		return data
+
+	def load_from_disk(self, disk_path, entry_key, key):
+		try:
+			with np.load(disk_path) as f:
+				if (str(f['entry_key']) != repr(entry_key)) or (tuple(f['key']) != key):
+					return None
+				return f['data']
+		except (IOError, ValueError, KeyError):
+			return None
+
+	def save_to_disk(self, disk_path, entry_key, key, data):
+		np.savez(disk_path, entry_key = repr(entry_key), key = np.array(key, dtype = np.int64), data = data)
+
+parsed_file_cache = ParsedFileCache()
+
+def parse_text_file(file_path, skip_lines, usecols):
+	'''
+	Reads the given columns of a whitespace-delimited table of numbers (e.g., BET/ISP and SVT logs), after skipping skip_lines lines.
+	Always returns a 2D float64 array, with one column for each of usecols.
+
+	np.loadtxt() is used first, since it is several times faster than np.genfromtxt() (at least for numpy >= 1.23).
+	Files it can't read (e.g., with missing values) fall back to np.genfromtxt().
+	(BET/ISP files were already read with np.loadtxt(), so only SVT files are parsed faster than before.
+	For BET/ISP files, the speedup is only from not parsing them again, see ParsedFileCache.)
+	'''
+
+	try:
+		with warnings.catch_warnings():
+			# Empty files are fine
+			warnings.simplefilter('ignore', UserWarning)
+			data = np.loadtxt(file_path, skiprows = skip_lines, usecols = usecols, ndmin = 2)
+	except ValueError:
+		data = np.atleast_2d(np.genfromtxt(file_path, usecols = usecols, skip_header = skip_lines))
+
+	if data.size == 0:
+		return np.zeros((0, len(usecols)))
+
+	return data
+
+process_pool = None
+process_pool_size = 0
+process_pool_lock = threading.Lock()
 
-def get_BET_data(start_time, end_time, value_names):
+def get_process_pool(num_processes):
+	'''
+	Returns a pool of (at least) num_processes processes, for parsing files in parallel (see load_log_files()).
+	Starting the processes takes a while (up to a second on Windows), so the pool is kept between calls, and only restarted if more processes are needed.
+	'''
+
+	global process_pool, process_pool_size
+
+	with process_pool_lock:
+		if (process_pool is None) or (process_pool_size < num_processes):
+			if process_pool is not None:
+				process_pool.shutdown(wait = False)
+			process_pool = ProcessPoolExecutor(max_workers = num_processes)
+			process_pool_size = num_processes
+
+		return process_pool
+
+def shutdown_process_pool():
+	'''
+	Stops the processes started by get_process_pool(). They are started again the next time they are needed.
+	'''
+
+	global process_pool, process_pool_size
+
+	with process_pool_lock:
+		if process_pool is not None:
+			process_pool.shutdown(wait = False)
+		process_pool = None
+		process_pool_size = 0
+
+def load_log_files(files, skip_lines, usecols, source, num_processes = 1):
+	'''
+	Parses BET/ISP or SVT files (source = 'BET' or 'SVT') and applies their time offsets (see apply_log_offset()).
+	Returns a list with one array for each file that could be read, in the same order as files.
+
+	Files which are already in parsed_file_cache are taken from there, and the others are parsed and added to it.
+	If num_processes > 1 and more than one file has to be parsed, they are parsed in parallel in a pool of processes (see get_process_pool()).
+	(Parsing is CPU-bound, so threads wouldn't help.) On Windows, the calling script needs an "if __name__ == '__main__':" guard for this to work.
+	'''
+
+	usecols = tuple(usecols)
+
+	keys = [None]*len(files)
+	parsed = [None]*len(files)
+	for i, file in enumerate(files):
+		try:
+			keys[i], parsed[i] = parsed_file_cache.lookup(file['name'], skip_lines, usecols, source)
+		except:
+			print("Error loading file " + file['name'])
+
+	misses = [i for i in range(len(files)) if (keys[i] is not None) and (parsed[i] is None)]
+
+	futures = {}
+	if (num_processes > 1) and (len(misses) > 1):
+		pool = get_process_pool(num_processes)
+		try:
+			futures = {i: pool.submit(parse_text_file, files[i]['name'], skip_lines, usecols) for i in misses}
+		except BrokenProcessPool:
+			# E.g., a worker process was killed. Parse the files here instead, and start a new pool next time.
+			shutdown_process_pool()
+			futures = {}
+
+	for i in misses:
+		file_name = files[i]['name']
+		try:
+			if i in futures:
+				try:
+					parsed[i] = futures[i].result()
+					prof.add_file(source, file_name)
+					prof.count(source + ' files parsed in other processes')
+				except BrokenProcessPool:
+					shutdown_process_pool()
+					parsed[i] = parsed_file_cache.parse(file_name, skip_lines, usecols, source)
+			else:
+				parsed[i] = parsed_file_cache.parse(file_name, skip_lines, usecols, source)
+		except:
+			print("Error loading file " + file_name)
+			continue
+
+		parsed_file_cache.store(keys[i], parsed[i], file_name, skip_lines, usecols, source)
+
+	return [apply_log_offset(file, file_data.copy(), source) for file, file_data in zip(files, parsed) if file_data is not None]
+
+def apply_log_offset(file, file_data, source):
+	'''
+	Converts the time column of one parsed BET/ISP or SVT file (modified in place) to seconds after the start of the query.
+	file is a dictionary with the file 'name' and time 'offset' (and creation hour 'chour' for SVT files), see get_BET_data() and get_SVT_data().
+	'''
+
+	if source == 'SVT':
+		# Try to catch the condition where the creation time is at, e.g., 23:59, but the first
+		# time value is at, e.g., 00:01. Then the offset calculated in get_SVT_data() is off by a day.
+		if (file['chour'] >= 20) and (file_data.shape[0] > 0) and (file_data[0,0] < 0.25):
+			file_data[:,0] -= 1
+
+		# SVT time is in days
+		file_data[:,0] *= 86400
+
+	# Apply time offset
+	file_data[:,0] += file['offset']
+
+	return file_data
+
+def merge_log_pieces(pieces, total_time, num_cols):
+	'''
+	Merges the arrays from load_log_files() (time in the first column) into a single array sorted by time,
+	keeping only the rows with 0 < time < total_time. If there are none, returns an empty array with num_cols columns.
+
+	Each file is already sorted by time, so rather than concatenating everything, sorting it, and then trimming it (which copies all the data twice):
+	- each piece is trimmed with a binary search, which doesn't copy anything
+	- pieces which follow one another in time (the usual case, one file after another) are chained together and copied once
+	- if some pieces overlap, the chains are k-way merged: a stable argsort of their times is a timsort, which finds the sorted runs and only merges them.
+	'''
+
+	runs = []
+	for piece in pieces:
+		time = piece[:,0]
+
+		# Shouldn't happen, but just in case (e.g., missing times, which are dropped by the trim)
+		if not np.all(time[1:] >= time[:-1]):
+			piece = piece[np.argsort(time, kind = 'stable')]
+			time = piece[:,0]
+
+		i_start = np.searchsorted(time, 0.0, side = 'right')
+		i_end = np.searchsorted(time, total_time, side = 'left')
+
+		if i_end > i_start:
+			runs.append(piece[i_start:i_end])
+
+	if not runs:
+		return np.zeros((0, num_cols))
+
+	# Chain together runs which follow one another. Each chain is then one sorted run.
+	runs.sort(key = lambda run: run[0,0])
+
+	chains = []
+	for run in runs:
+		for chain in chains:
+			if chain[-1][-1,0] <= run[0,0]:
+				chain.append(run)
+				break
+		else:
+			chains.append([run])
+
+	merged = np.concatenate([run for chain in chains for run in chain], axis = 0)
+
+	if len(chains) > 1:
+		merged = merged[np.argsort(merged[:,0], kind = 'stable')]
+
+	return merged
+
+def set_data_root(root_dir):
+	'''
+	Points all the data imports at a local directory with the same layout as the server:
+		<root_dir>/Production Data/Molly data/YYYY/MM-Mon/...
+		<root_dir>/Production Data/BET data/...
+		<root_dir>/Production Data/ISP data/...
+		<root_dir>/ZW-XP1/...
+
+	If <root_dir>/file_times.json exists, the original file times are loaded from it (see load_file_times()).
+	If root_dir is None, the imports go back to the server.
+	'''
+
+	global production_data_path, SVT_data_path
+
+	if root_dir is None:
+		production_data_path = server_production_data_path
+		SVT_data_path = server_SVT_data_path
+		return
+
+	production_data_path = os.path.join(root_dir, 'Production Data')
+	SVT_data_path = os.path.join(root_dir, 'ZW-XP1')
+
+	if os.path.exists(os.path.join(root_dir, 'file_times.json')):
+		load_file_times(root_dir)
+
+#def import_to_csv(start_time, end_time, value_names, delta_t, file_name, delimiter = '\t'):
+def import_to_csv(value_names, data, file_name, delimiter = ',', block_rows = 10000):
+	'''
+	Writes data to a .csv file, after a header line with the value names.
+
+	data can be:
+	- a dictionary of equal-length arrays (e.g., from get_data() with delta_t != -1), written as one column for each value.
+		Envelope values ({'min': ..., 'max': ...}) are written as two columns, "<name> min" and "<name> max".
+	- a dictionary of raw {'time': ..., 'vals': ...} data (e.g., from get_data() with delta_t == -1), written as rows of (name, time, value).
+	- an iterable of either of these (e.g., the chunks from iter_Molly_data()), written one after another.
+		Only one chunk is held in memory at a time, so long time ranges can be exported in constant memory. (See export_to_csv())
+
+	Numbers are written as with '%.8g' (or '%d' for integer arrays, e.g., times in ms), block_rows rows at a time (see format_csv_rows()).
+	'''
+
+	chunks = [data] if isinstance(data, dict) else data
+
+	with open(file_name, 'wb') as out_file:
+
+		header_written = False
+		for chunk in chunks:
+
+			raw = any(isinstance(chunk[name], dict) and ('time' in chunk[name]) for name in value_names)
+
+			if raw:
+				if not header_written:
+					out_file.write(bytes(delimiter.join(['Name', 'Time', 'Value']) + '\n', 'utf8'))
+					header_written = True
+
+				for name in value_names:
+					write_csv_rows(out_file, [chunk[name]['time'], chunk[name]['vals']], delimiter, name + delimiter, block_rows)
+			else:
+				column_names, columns = get_csv_columns(value_names, chunk)
+
+				if not header_written:
+					out_file.write(bytes(delimiter.join(column_names) + '\n', 'utf8'))
+					header_written = True
+
+				write_csv_rows(out_file, columns, delimiter, '', block_rows)
+
+		# Nothing to write, but the file should still have a header
+		if not header_written:
+			out_file.write(bytes(delimiter.join(value_names) + '\n', 'utf8'))
+
+def get_csv_columns(value_names, data):
+	'''
+	Returns (column names, column arrays) for the given values in data, splitting envelope values into min and max columns
+	'''
+
+	column_names = []
+	columns = []
+	for name in value_names:
+		if isinstance(data[name], dict):
+			for key in ['min', 'max']:
+				column_names.append(f'{name} {key}')
+				columns.append(data[name][key])
+		else:
+			column_names.append(name)
+			columns.append(data[name])
+
+	return column_names, columns
+
+def write_csv_rows(out_file, columns, delimiter = ',', prefix = '', block_rows = 10000):
+	'''
+	Writes equal-length columns to out_file (opened in binary mode), block_rows rows at a time
+	'''
+
+	num_rows = len(columns[0]) if columns else 0
+
+	for start in range(0, num_rows, block_rows):
+		block = [col[start:start + block_rows] for col in columns]
+		out_file.write(bytes(format_csv_rows(block, delimiter, prefix), 'utf8'))
+
+def format_csv_rows(columns, delimiter = ',', prefix = ''):
+	'''
+	Formats equal-length columns as .csv rows. Each row starts with prefix.
+	The output is exactly the same as np.savetxt() with fmt = '%.8g' (or '%d' for integer columns), but several times faster:
+	- Molly data repeats the same values over and over (especially step-interpolated data), so each distinct value in a column is only formatted once.
+	- All the fields and delimiters are then joined with a single str.join(), rather than one string formatting operation per row.
+	'''
+
+	columns = [np.asarray(col) for col in columns]
+	num_rows = columns[0].size
+
+	# Row layout: prefix, value, delimiter, value, delimiter, ..., value, newline
+	fields = np.empty((num_rows, 2*len(columns) + 1), dtype = object)
+	fields[:,0] = prefix
+	fields[:,2::2] = delimiter
+	fields[:,-1] = '\n'
+
+	for ind, col in enumerate(columns):
+		fmt = '%d' if np.issubdtype(col.dtype, np.integer) else '%.8g'
+
+		uniq, inverse = np.unique(col, return_inverse = True)
+		fields[:,2*ind + 1] = np.array([fmt % val for val in uniq.tolist()], dtype = object)[inverse.ravel()]
+
+	return ''.join(fields.ravel().tolist())
+
+def export_to_csv(start_time, end_time, value_names_list, file_name, delta_t = -1, interp = False, chunk = dt.timedelta(hours = 6), archive = None, mode = None, delimiter = ',', value_dtype = np.float64, time_unit = 's'):
+	'''
+	Streams Molly data from start_time to end_time straight into a .csv file, one chunk at a time (see iter_Molly_data() and import_to_csv()).
+	Memory use only depends on chunk, not on the length of the time range.
+
+	The arguments are the same as for get_data() and iter_Molly_data(). value_dtype and time_unit are applied to each chunk (see convert_Molly_data()),
+	so the file is the same as import_to_csv() of get_data() with the same arguments (e.g., times in ms are written as integers).
+	Only Molly values are allowed, since BET and SVT data aren't on a shared time grid.
+	With delta_t == -1, the raw data is written as rows of (name, time, value), chunk by chunk.
+	'''
+
+	local_value_names = get_local_value_names(value_names_list)
+
+	if local_value_names["BET"] or local_value_names["SVT"]:
+		raise Exception("export_to_csv() only supports Molly values")
+
+	readable_names = {value_names_database[val]['Local value name']: val for val in value_names_list}
+
+	if delta_t == -1:
+		# There is no shared time array for raw data
+		value_names_list = [val for val in value_names_list if value_names_database[val]['Local value name'] != "Time"]
+
+	def readable_chunks():
+		for data in iter_Molly_data(start_time, end_time, local_value_names["Molly"], delta_t, interp, chunk, archive, mode):
+			data = convert_Molly_data(data, value_dtype, time_unit)
+			yield {readable_names[name]: vals for name, vals in data.items()}
+
+	import_to_csv(value_names_list, readable_chunks(), file_name, delimiter)
+
+def get_BET_data(start_time, end_time, value_names, value_dtype = np.float64, time_unit = 's', num_processes = 1):
 	'''
 	Only allowed value names are 'ISP Time', 'ISP Integral', 'ISP Temp', 'BET Time', 'BET Temp'
 
 	Values starting with 'ISP' are stored in a different file than values starting with 'BET', so have to separate them.
+
+	value_dtype and time_unit set the format of the output (see get_data()).
+	If num_processes > 1, the files are parsed in parallel (see load_log_files()).
 	'''
 	if not value_names: return {} # Redundant, but increases speed.
 
-	base_dir = r"\\insitu1.nexus.uwaterloo.ca\Documents\QNC MBE Data\Production Data"
+	base_dir = production_data_path
 
 	# Information about which file (sublocation) and column each value is in.
 	info = {
@@ -397,6 +1924,11 @@ def get_BET_data(start_time, end_time, value_names):
 		'BET Temp': {'subloc': 'BET', 'col': 1}
 	}
 
+	# Columns read from each file
+	cols = {}
+	cols['ISP'] = (0,1,2)
+	cols['BET'] = (0,1)
+
 	sublocs = []
 	for name in value_names:
 		subloc = info[name]['subloc']
@@ -409,45 +1941,21 @@ def get_BET_data(start_time, end_time, value_names):
 		path[subloc] = os.path.join(base_dir, subloc + " data")
 		files[subloc] = []
 
-		dir_files = os.listdir(path[subloc])
-
-		for dir_file in dir_files:
-			full_filepath = os.path.join(path[subloc], dir_file)
-			ctime = dt.datetime.fromtimestamp(os.path.getctime(full_filepath))
-			mtime = dt.datetime.fromtimestamp(os.path.getmtime(full_filepath))
-
-			time_condition = (start_time < mtime) and (end_time > ctime)
-
-			name_condition = (dir_file.startswith(subloc)) and (dir_file.endswith('.dat'))
-			if time_condition and name_condition:
+		with prof.stage('BET file listing'):
+			# Only the files being written between start_time and end_time (see FileCatalog)
+			for full_filepath, ctime, mtime in file_catalog.get_files(path[subloc], start_time, end_time, prefix = subloc, suffix = '.dat'):
 				offset = (ctime - start_time).total_seconds()
 				files[subloc].append({'name': full_filepath, 'offset': offset})
 	
 	# Get data from each file, and apply time offsets
 	raw_data = {}
 	for subloc in sublocs:
-		raw_data[subloc] = []
-		for file in files[subloc]:
-			try:
-				file_data = np.loadtxt(file['name'], skiprows = 1)
-			except:
-				print("Error loading file " + file['name'])
-
-			# Apply time offset
-			file_data[:,0] += file['offset']
-
-			raw_data[subloc].append(file_data)
-
-		if (len(raw_data[subloc]) != 0):
-			raw_data[subloc] = np.concatenate(raw_data[subloc], axis = 0)
-			sorted_inds = np.argsort(raw_data[subloc][:,0])
-			raw_data[subloc] = raw_data[subloc][sorted_inds, :]
+		with prof.stage('BET parsing'):
+			raw_data[subloc] = load_log_files(files[subloc], 1, cols[subloc], 'BET', num_processes)
 
+		with prof.stage('BET merge'):
 			total_time = (end_time - start_time).total_seconds()
-			trimmed_inds = np.logical_and(0.0 < raw_data[subloc][:,0], raw_data[subloc][:,0] < total_time)
-			raw_data[subloc] = raw_data[subloc][trimmed_inds,:]
-		else:
-			raw_data[subloc] = np.zeros((0,4))
+			raw_data[subloc] = merge_log_pieces(raw_data[subloc], total_time, len(cols[subloc]))
 
 	data = {}
 	for name in value_names:
@@ -456,9 +1964,14 @@ def get_BET_data(start_time, end_time, value_names):
 
 		data[name] = raw_data[subloc][:,col]
 
+		if col == 0:
+			data[name] = convert_time(data[name], time_unit)
+		else:
+			data[name] = data[name].astype(value_dtype)
+
 	return data
 
-def get_SVT_data(start_time, end_time, value_names):
+def get_SVT_data(start_time, end_time, value_names, value_dtype = np.float64, time_unit = 's', num_processes = 1):
 
 	'''
 	Only allowed value names are:
@@ -473,10 +1986,12 @@ def get_SVT_data(start_time, end_time, value_names):
 		SVT Time (RoboMBE IS4K Refl)
 		Calib 950
 		Calib 470
+	value_dtype and time_unit set the format of the output (see get_data()).
+	If num_processes > 1, the files are parsed in parallel (see load_log_files()).
 	'''
 	if not value_names: return {} # Redundant, but increases speed.
 
-	path = "\\\\insitu1.nexus.uwaterloo.ca\\QNC_MBE_Data\\ZW-XP1\\"
+	path = SVT_data_path
 	#path = r"\\insitu1.nexus.uwaterloo.ca\Documents\QNC MBE Data\Production Data\SVT Data"
 
 	# Different values are stored in different files and columns, so need information about which value is where.
@@ -509,21 +2024,16 @@ def get_SVT_data(start_time, end_time, value_names):
 		if info[name]['subloc'] not in sublocs:
 			sublocs.append(subloc)
 
-	# Get list of all the .txt files in all the subdirectories
-	dir_files = [y for x in os.walk(path) for y in glob(os.path.join(x[0], '*.txt'))]
-
-	files = {subloc: [] for subloc in sublocs}
-
-	for subloc in sublocs:
+	# Get the .txt files in all the subdirectories which were being written between start_time and end_time (see FileCatalog)
+	with prof.stage('SVT file listing'):
+		dir_files = file_catalog.get_tree_files(path, start_time, end_time, suffix = '.txt', log_suffixes = [subloc + '.txt' for subloc in cols])
 
-		for dir_file in dir_files:
-			if dir_file.endswith(subloc + '.txt'):
-				ctime = dt.datetime.fromtimestamp(os.path.getctime(dir_file))
-				mtime = dt.datetime.fromtimestamp(os.path.getmtime(dir_file))
+		files = {subloc: [] for subloc in sublocs}
 
-				time_condition = (start_time < mtime) and (end_time > ctime)
+		for subloc in sublocs:
 
-				if time_condition:
+			for dir_file, ctime, mtime in dir_files:
+				if dir_file.endswith(subloc + '.txt'):
 
 					# Note: this offset may fail if the creation time is not on the same day as
 					# the first time value. I really wish there was a more robust way to do this...
@@ -533,37 +2043,14 @@ def get_SVT_data(start_time, end_time, value_names):
 	# Get all the required data from files
 	raw_data ={}
 	for subloc in sublocs:
-		raw_data[subloc] = []
-		for file in files[subloc]:
-			try:
-				file_data = np.genfromtxt(file['name'], usecols = cols[subloc], skip_header = 3)
-				# Note, setting skip_header = 3 will typically discard the first two data points, but
-				# otherwise there can be problems when someone starts logging before turning on the Engine
-			except:
-				print("Error loading file " + file['name'])
-
-			# Try to catch the condition where the creation time is at, e.g., 23:59, but the first
-			# time value is at, e.g., 00:01. Then the offset calculated above is off by a day.
-			if (file['chour'] >= 20) and (file_data[0,0] < 0.25):
-				file_data[:,0] -= 1
-
-			# Apply time offset
-			file_data[:,0] *= 86400
-			file_data[:,0] += file['offset']
-
-
-			raw_data[subloc].append(file_data)
-
-		if len(raw_data[subloc]) != 0:
-			raw_data[subloc] = np.concatenate(raw_data[subloc], axis=0)
-			sorted_inds = np.argsort(raw_data[subloc][:,0])
-			raw_data[subloc] = raw_data[subloc][sorted_inds, :]
+		# Note, skipping 3 lines will typically discard the first two data points, but
+		# otherwise there can be problems when someone starts logging before turning on the Engine
+		with prof.stage('SVT parsing'):
+			raw_data[subloc] = load_log_files(files[subloc], 3, cols[subloc], 'SVT', num_processes)
 
+		with prof.stage('SVT merge'):
 			total_time = (end_time - start_time).total_seconds()
-			trimmed_inds = np.logical_and(0.0 < raw_data[subloc][:,0], raw_data[subloc][:,0] < total_time)
-			raw_data[subloc] = raw_data[subloc][trimmed_inds,:]
-		else:
-			raw_data[subloc] = np.zeros((0,5))
+			raw_data[subloc] = merge_log_pieces(raw_data[subloc], total_time, len(cols[subloc]))
 
 
 	data = {}
@@ -572,4 +2059,12 @@ def get_SVT_data(start_time, end_time, value_names):
 		col = info[name]['col']
 		data[name] = raw_data[subloc][:,col]
 
+		if col == 0:
+			data[name] = convert_time(data[name], time_unit)
+		else:
+			data[name] = data[name].astype(value_dtype)
+
 	return data
+
+if os.environ.get('QNCMBE_DATA_ROOT'):
+	set_data_root(os.environ['QNCMBE_DATA_ROOT'])
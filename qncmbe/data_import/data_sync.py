@@ -0,0 +1,262 @@
+'''
+Keeps a local copy of the lab data up to date, so that data imports don't have to go back to the server every time.
+
+DataSync mirrors the Molly hour files, the BET/ISP .dat files, and the SVT .txt logs into a local directory with the same layout as the server:
+	<mirror_dir>/Production Data/Molly data/YYYY/MM-Mon/...
+	<mirror_dir>/Production Data/BET data/...
+	<mirror_dir>/Production Data/ISP data/...
+	<mirror_dir>/ZW-XP1/...
+	<mirror_dir>/file_times.json
+
+Files are compared to the last sync by size and modification time, and only new or changed files are touched.
+BET/ISP and SVT logs grow while they are being written, so only the newly-appended bytes are copied.
+(Molly rewrites the current hour files as it goes, so those are copied whole whenever they change.)
+
+The BET and SVT data are timed relative to the file creation time, which is lost when copying.
+So the original creation and modification times are recorded in file_times.json. (See data_import_utils.get_file_times())
+
+Typical usage (e.g., in a long-running script):
+	sync = DataSync('C:\\QNC-MBE data mirror', since = dt.datetime(2019,1,1))
+	sync.run(interval = 60)
+
+Or, in an interactive session:
+	sync.start()    # Syncs in a background thread
+	sync.activate() # get_data() etc. now read from the mirror
+'''
+
+# Standard library imports (not included in setup.py)
+import datetime as dt
+import os
+import json
+import threading
+import traceback
+
+# qncmbe imports
+from . import data_import_utils as datimp
+
+class DataSync():
+	def __init__(self, mirror_dir, since = None, production_data_path = None, SVT_data_path = None):
+		'''
+		- mirror_dir is the local directory to mirror the data into. (It is created if it doesn't exist.)
+		- since is a datetime. Files last modified before this time are not mirrored. If None, everything is mirrored.
+		- production_data_path and SVT_data_path are the source directories. Default to the server locations in data_import_utils (even if the imports have been pointed elsewhere with set_data_root()).
+		'''
+
+		self.mirror_dir = mirror_dir
+		self.since = since
+
+		if production_data_path is None:
+			production_data_path = datimp.server_production_data_path
+		if SVT_data_path is None:
+			SVT_data_path = datimp.server_SVT_data_path
+
+		# Source directory and corresponding mirror subdirectory
+		self.sources = {
+			'Production Data': production_data_path,
+			'ZW-XP1': SVT_data_path
+		}
+
+		self.state_path = os.path.join(mirror_dir, 'file_times.json')
+		self.stop_event = threading.Event()
+		self.thread = None
+		self.active = False
+
+		self.load_state()
+
+	def load_state(self):
+		if os.path.exists(self.state_path):
+			with open(self.state_path, 'r') as f:
+				self.state = json.load(f)
+		else:
+			self.state = {}
+
+	def save_state(self):
+		def write(tmp_path):
+			with open(tmp_path, 'w') as f:
+				json.dump(self.state, f, indent = 1)
+
+		datimp.replace_file(self.state_path, write)
+
+	def get_source_files(self):
+		'''
+		Returns a list of (source path, relative path) for all the files that should be mirrored.
+		Relative paths use '/' as the separator, and are relative to the mirror directory.
+		'''
+
+		files = []
+
+		# Molly data. Only look in the month folders which could contain files modified since self.since
+		Molly_dir = os.path.join(self.sources['Production Data'], 'Molly data')
+		for year in list_dir(Molly_dir):
+			if not os.path.isdir(os.path.join(Molly_dir, year)):
+				continue
+
+			for month in list_dir(os.path.join(Molly_dir, year)):
+				month_dir = os.path.join(Molly_dir, year, month)
+				if self.since is not None:
+					try:
+						if (int(year), int(month[:2])) < (self.since.year, self.since.month):
+							continue
+					except ValueError:
+						pass
+
+				for name in list_dir(month_dir):
+					files.append((os.path.join(month_dir, name), '/'.join(['Production Data', 'Molly data', year, month, name])))
+
+		# BET and ISP data
+		for subloc in ['BET', 'ISP']:
+			subloc_dir = os.path.join(self.sources['Production Data'], subloc + ' data')
+			for name in list_dir(subloc_dir):
+				if name.startswith(subloc) and name.endswith('.dat'):
+					files.append((os.path.join(subloc_dir, name), '/'.join(['Production Data', subloc + ' data', name])))
+
+		# SVT data
+		SVT_dir = self.sources['ZW-XP1']
+		for dir_path, dir_names, file_names in os.walk(SVT_dir):
+			rel_dir = os.path.relpath(dir_path, SVT_dir)
+			for name in file_names:
+				if name.endswith('.txt'):
+					rel_path = os.path.normpath(os.path.join('ZW-XP1', rel_dir, name)).replace(os.sep, '/')
+					files.append((os.path.join(dir_path, name), rel_path))
+
+		return files
+
+	def sync_once(self):
+		'''
+		Copies all new and changed data from the sources into the mirror.
+		Returns a dictionary of statistics: number of files checked, number of files updated, and number of bytes copied.
+		'''
+
+		stats = {'files checked': 0, 'files updated': 0, 'bytes copied': 0}
+
+		for src_path, rel_path in self.get_source_files():
+			try:
+				stat = os.stat(src_path)
+			except OSError:
+				continue
+
+			if (self.since is not None) and (dt.datetime.fromtimestamp(stat.st_mtime) < self.since):
+				continue
+
+			stats['files checked'] += 1
+
+			copied = self.sync_file(src_path, rel_path, stat)
+			if copied is not None:
+				stats['files updated'] += 1
+				stats['bytes copied'] += copied
+
+		self.save_state()
+
+		if self.active:
+			datimp.load_file_times(self.mirror_dir)
+
+		return stats
+
+	def sync_file(self, src_path, rel_path, stat):
+		'''
+		Brings a single mirrored file up to date with its source.
+		Returns the number of bytes copied, or None if the file was already up to date.
+		'''
+
+		entry = self.state.get(rel_path)
+
+		if (entry is not None) and (entry['size'] == stat.st_size) and (entry['mtime'] == stat.st_mtime):
+			return None
+
+		dst_path = os.path.join(self.mirror_dir, *rel_path.split('/'))
+		os.makedirs(os.path.dirname(dst_path), exist_ok = True)
+
+		is_text_log = not rel_path.startswith('Production Data/Molly data/')
+
+		if is_text_log and (entry is not None) and (stat.st_size >= entry['size']) and os.path.exists(dst_path) and (os.path.getsize(dst_path) == entry['size']):
+			# Log has grown: append only the new data
+			start = entry['size']
+		else:
+			start = 0
+
+		with open(src_path, 'rb') as src:
+			src.seek(start)
+			new_data = src.read(stat.st_size - start)
+
+		# Text logs may be partway through writing a line. Only copy complete lines, unless the file has stopped changing
+		settled = (entry is not None) and (entry['mtime'] == stat.st_mtime)
+		if is_text_log and not settled:
+			new_data = new_data[:new_data.rfind(b'\n') + 1]
+
+		if start > 0:
+			# (Only complete lines are appended, so imports reading the mirror at the same time never see a partial line)
+			with open(dst_path, 'ab') as dst:
+				dst.write(new_data)
+		else:
+			# Whole files are replaced at once, so that imports reading the mirror at the same time (see activate()) never see a partially-written file
+			def write(tmp_path):
+				with open(tmp_path, 'wb') as dst:
+					dst.write(new_data)
+
+			datimp.replace_file(dst_path, write)
+
+		ctime, mtime = datimp.get_file_times(src_path)
+
+		self.state[rel_path] = {
+			'size': start + len(new_data),
+			'mtime': stat.st_mtime,
+			'ctime': ctime.timestamp()
+		}
+
+		# Keep the mirror's own modification time in line with the source
+		os.utime(dst_path, (stat.st_atime, stat.st_mtime))
+
+		return len(new_data)
+
+	def run(self, interval = 60):
+		'''
+		Syncs every interval seconds until stop() is called (or the process is killed).
+		Errors (e.g., a dropped network connection) are printed, and the sync is retried on the next round.
+		'''
+
+		self.stop_event.clear()
+
+		while not self.stop_event.is_set():
+			try:
+				stats = self.sync_once()
+				if stats['files updated']:
+					print(f"{dt.datetime.now():%Y-%m-%d %H:%M:%S} Synced {stats['files updated']} files ({stats['bytes copied']} bytes)")
+			except Exception:
+				traceback.print_exc()
+
+			self.stop_event.wait(interval)
+
+	def start(self, interval = 60):
+		'''
+		Same as run(), but in a background thread.
+		'''
+
+		self.thread = threading.Thread(target = self.run, args = (interval,), daemon = True)
+		self.thread.start()
+
+	def stop(self):
+		self.stop_event.set()
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+	def activate(self):
+		'''
+		Points data_import_utils at the mirror, so that get_data(), get_BET_data(), get_SVT_data(), etc. read the local copy.
+		'''
+
+		self.save_state()
+
+		datimp.set_data_root(self.mirror_dir)
+
+		self.active = True
+
+def list_dir(path):
+	'''
+	Same as os.listdir(), but returns an empty list if the directory doesn't exist.
+	'''
+
+	try:
+		return sorted(os.listdir(path))
+	except OSError:
+		return []
@@ -0,0 +1,144 @@
+'''
+Optional profiling of data imports: where the time goes, and how much is read from where.
+
+Usage:
+	profile = ImportProfile()
+	data = get_data(start_time, end_time, value_names_list, delta_t, profile = profile)
+	print(profile)
+
+Or pass a function, which is called with the ImportProfile once the import is done:
+	data = get_data(start_time, end_time, value_names_list, delta_t, profile = lambda p: log.append(p.as_dict()))
+
+The import functions in data_import_utils.py (and molly_archive.py, molly_index.py) report to the profile of the import in progress through stage(), count(), and add_bytes().
+When no import is being profiled, these do nothing.
+
+The profile in progress is module-level state, so only one import can be profiled at a time (profiling() raises an exception otherwise).
+Imports which use several threads are fine: all the threads report to the same profile.
+But for the same reason, unprofiled imports running in other threads at the same time are also counted in the profile.
+'''
+
+# Standard library imports (not included in setup.py)
+import os
+import threading
+import time as tm
+from contextlib import contextmanager
+
+# Profile of the import in progress (see profiling()). None when nothing is being profiled.
+current_profile = None
+current_profile_lock = threading.Lock()
+
+class ImportProfile():
+	'''
+	Timing breakdown and I/O statistics for one import.
+
+	- stage_times: {stage: seconds}. Stages are, e.g., 'Molly header parse', 'Molly binary read', 'Molly concatenation', 'Molly resampling',
+		'BET file listing', 'BET parsing', 'SVT file listing', 'SVT parsing'.
+		Times are summed over threads, so with several threads they can add up to more than total_time.
+	- counts: {name: number}, e.g., 'Molly files opened', 'Molly files missing', 'header cache hits'
+	- bytes_read: {source: bytes}, where source is 'Molly', 'BET', or 'SVT'
+	- total_time: wall time of the whole import, in seconds
+	'''
+
+	def __init__(self):
+		self.stage_times = {}
+		self.counts = {}
+		self.bytes_read = {}
+		self.total_time = 0.0
+
+		self.lock = threading.Lock()
+
+	def add_time(self, stage, seconds):
+		with self.lock:
+			self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+
+	def add_count(self, name, n = 1):
+		with self.lock:
+			self.counts[name] = self.counts.get(name, 0) + n
+
+	def add_bytes(self, source, n):
+		with self.lock:
+			self.bytes_read[source] = self.bytes_read.get(source, 0) + n
+
+	def as_dict(self):
+		return {
+			'total_time': self.total_time,
+			'stage_times': dict(self.stage_times),
+			'counts': dict(self.counts),
+			'bytes_read': dict(self.bytes_read)
+		}
+
+	def __str__(self):
+		lines = [f'Total time: {self.total_time:.3f} s', 'Stage times:']
+		for stage, seconds in sorted(self.stage_times.items(), key = lambda item: -item[1]):
+			lines.append(f'    {stage:<30} {seconds:10.3f} s')
+
+		lines.append('Bytes read:')
+		for source, n in self.bytes_read.items():
+			lines.append(f'    {source:<30} {n:10d}')
+
+		lines.append('Counts:')
+		for name, n in self.counts.items():
+			lines.append(f'    {name:<30} {n:10d}')
+
+		return '\n'.join(lines)
+
+@contextmanager
+def profiling(profile):
+	'''
+	Makes profile the profile in progress for the duration of the with block, and records the total time.
+	Raises an exception if another profile is already in progress (e.g., a profiled import in another thread).
+	(Profiling with the same profile again inside the with block is fine.)
+	'''
+
+	global current_profile
+
+	with current_profile_lock:
+		previous = current_profile
+		if (previous is not None) and (previous is not profile):
+			raise Exception("Another import is already being profiled. Only one import can be profiled at a time.")
+		current_profile = profile
+
+	t = tm.perf_counter()
+	try:
+		yield profile
+	finally:
+		profile.total_time += tm.perf_counter() - t
+		with current_profile_lock:
+			current_profile = previous
+
+@contextmanager
+def stage(name):
+	'''
+	Adds the time spent in the with block to the given stage of the profile in progress (if any)
+	'''
+
+	profile = current_profile
+	if profile is None:
+		yield
+		return
+
+	t = tm.perf_counter()
+	try:
+		yield
+	finally:
+		profile.add_time(name, tm.perf_counter() - t)
+
+def count(name, n = 1):
+	profile = current_profile
+	if profile is not None:
+		profile.add_count(name, n)
+
+def add_bytes(source, n):
+	profile = current_profile
+	if profile is not None:
+		profile.add_bytes(source, n)
+
+def add_file(source, file_path):
+	'''
+	Counts a whole file as opened and read (only checking its size if an import is being profiled)
+	'''
+
+	profile = current_profile
+	if profile is not None:
+		profile.add_count(source + ' files opened')
+		profile.add_bytes(source, os.path.getsize(file_path))
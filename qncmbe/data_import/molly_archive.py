@@ -0,0 +1,249 @@
+'''
+Local archive of Molly data, so that long-range queries don't have to read every hour file from the server.
+
+Molly stores all signals together, in one pair of files per hour (see get_raw_Molly_data_hour()).
+So, e.g., getting one month of a single cell temperature means reading ~750 hour files from the server.
+The archive instead stores one small file per signal per day, so a query only reads the bytes it needs.
+
+Layout of the archive directory:
+	manifest.json
+	<signal directory>/YYYY-MM-DD.npz
+
+Each .npz file holds one day of one signal, with three arrays:
+	- 'time': float32 Molly time (days relative to midnight), exactly as stored in the binary files
+	- 'vals': float32 values
+	- 'hour_index': 25 integers. The data from hour file h is time[hour_index[h]:hour_index[h+1]]
+
+The data is kept exactly as Molly stored it, hour boundaries included, so the archive gives exactly the same results as reading the hour files.
+
+manifest.json lists the archived days of each signal: {'version': 1, 'signals': {name: {'dir': ..., 'days': [...]}}}
+
+Typical usage:
+	archive = MollyArchive('C:\\Molly archive')
+	archive.build(dt.datetime(2019,1,1), dt.datetime(2019,6,30), value_names)
+	data = get_data(start_time, end_time, value_names_list, delta_t, archive = archive)
+'''
+
+# Standard library imports (not included in setup.py)
+import datetime as dt
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# qncmbe imports
+from . import data_import_utils as datimp
+from . import import_profile as prof
+from .value_names import value_names_database
+
+# Non-standard library imports (included in setup.py)
+import numpy as np
+
+archive_version = 1
+
+class MollyArchive():
+	def __init__(self, archive_dir, fallback = True, max_cached_days = 64):
+		'''
+		- archive_dir is the local directory containing the archive. (It is created if it doesn't exist.)
+		- fallback determines what happens when a query needs a day that isn't archived.
+			If True, the data is read from the server as usual. Otherwise, it is treated as missing.
+		- max_cached_days is the number of signal-days kept in memory after being loaded
+		'''
+
+		self.archive_dir = archive_dir
+		self.fallback = fallback
+		self.max_cached_days = max_cached_days
+
+		self.manifest_path = os.path.join(archive_dir, 'manifest.json')
+
+		self.lock = threading.Lock()
+		self.cached_days = OrderedDict()
+
+		self.load_manifest()
+
+	def load_manifest(self):
+
+		if os.path.exists(self.manifest_path):
+			with open(self.manifest_path, 'r') as f:
+				self.manifest = json.load(f)
+
+			if self.manifest['version'] != archive_version:
+				raise Exception(f"Unsupported Molly archive version {self.manifest['version']} in {self.archive_dir}")
+		else:
+			self.manifest = {'version': archive_version, 'signals': {}}
+
+		self.archived_days = {name: set(entry['days']) for name, entry in self.manifest['signals'].items()}
+
+	def save_manifest(self):
+
+		for name, days in self.archived_days.items():
+			self.manifest['signals'][name]['days'] = sorted(days)
+
+		def write(tmp_path):
+			with open(tmp_path, 'w') as f:
+				json.dump(self.manifest, f, indent = 1)
+
+		datimp.replace_file(self.manifest_path, write)
+
+	def get_signal_dir(self, name):
+		'''
+		Returns the directory for a given (local) Molly value name, adding it to the manifest if necessary.
+		'''
+
+		if name not in self.manifest['signals']:
+			dir_name = re.sub(r'[^A-Za-z0-9._-]', '_', name)
+
+			used = {entry['dir'] for entry in self.manifest['signals'].values()}
+			base_name = dir_name
+			n = 1
+			while dir_name in used:
+				dir_name = f'{base_name}_{n}'
+				n += 1
+
+			self.manifest['signals'][name] = {'dir': dir_name, 'days': []}
+			self.archived_days[name] = set()
+
+		return os.path.join(self.archive_dir, self.manifest['signals'][name]['dir'])
+
+	def get_day_path(self, name, day):
+		return os.path.join(self.get_signal_dir(name), day.strftime('%Y-%m-%d.npz'))
+
+	def has_day(self, name, day):
+		return day.strftime('%Y-%m-%d') in self.archived_days.get(name, ())
+
+	def archive_day(self, day, value_names, num_threads = 1):
+		'''
+		Reads all the hour files for the given day from the server and archives the given (local) Molly value names.
+		'''
+
+		day = day.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+		hours = [day + dt.timedelta(hours = h) for h in range(24)]
+
+		pairs = {name: [] for name in value_names}
+
+		def get_hour(hour):
+			return datimp.get_raw_Molly_data_hour(hour, value_names, use_mmap = True)
+
+		with ThreadPoolExecutor(max_workers = max(num_threads, 1)) as executor:
+			data_hours = executor.map(get_hour, hours) if (num_threads > 1) else map(get_hour, hours)
+
+			for data_hour in data_hours:
+				for name in value_names:
+					# Copy, so that the memory-mapped file can be closed
+					pairs[name].append(np.array(data_hour[name].pairs))
+
+		with self.lock:
+			for name in value_names:
+				hour_index = np.zeros(25, dtype = np.int64)
+				hour_index[1:] = np.cumsum([p.shape[0] for p in pairs[name]])
+
+				day_pairs = np.concatenate(pairs[name], axis = 0)
+
+				# (Imports reading the archive at the same time never see a partially-written day, see replace_file())
+				datimp.replace_file(self.get_day_path(name, day), lambda tmp_path: np.savez(tmp_path,
+					time = day_pairs[:,0],
+					vals = day_pairs[:,1],
+					hour_index = hour_index))
+
+				self.archived_days[name].add(day.strftime('%Y-%m-%d'))
+				self.cached_days.pop((name, day), None)
+
+			self.save_manifest()
+
+	def build(self, start_day, end_day, value_names = None, overwrite = False, num_threads = 1):
+		'''
+		Archives each day from start_day to end_day (inclusive) for the given (local) Molly value names.
+		If value_names is None, all Molly values in value_names_database are archived.
+
+		Days that are already archived are skipped unless overwrite == True.
+		Days which are not over yet are also skipped, since their hour files may still change.
+		'''
+
+		if value_names is None:
+			value_names = [vn['Local value name'] for vn in value_names_database.values() if vn['Location'] == 'Molly']
+			value_names = [name for name in value_names if name != 'Time']
+
+		day = start_day.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+
+		while day <= end_day:
+
+			if day + dt.timedelta(days = 1, hours = 1) > dt.datetime.now():
+				print(f"Skipping {day.date()}: the day is not over yet")
+
+			else:
+				if overwrite:
+					names = list(value_names)
+				else:
+					names = [name for name in value_names if not self.has_day(name, day)]
+
+				if names:
+					print(f"Archiving Molly data for {day.date()}...")
+					self.archive_day(day, names, num_threads)
+
+			day += dt.timedelta(days = 1)
+
+	def load_day(self, name, day):
+		'''
+		Returns (time, vals, hour_index) for one archived signal-day. See module docstring for the format.
+		'''
+
+		key = (name, day)
+
+		with self.lock:
+			if key in self.cached_days:
+				self.cached_days.move_to_end(key)
+				prof.count('archive cache hits')
+				return self.cached_days[key]
+
+			day_path = self.get_day_path(name, day)
+
+		with np.load(day_path) as f, prof.stage('archive read'):
+			day_data = (f['time'], f['vals'], f['hour_index'])
+
+		prof.add_file('archive', day_path)
+
+		with self.lock:
+			self.cached_days[key] = day_data
+			while len(self.cached_days) > self.max_cached_days:
+				self.cached_days.popitem(last = False)
+
+		return day_data
+
+	def get_raw_Molly_data_hour(self, import_time, value_names):
+		'''
+		Same as datimp.get_raw_Molly_data_hour(), but reads from the archive where possible.
+
+		Values that aren't archived for that day are read from the server if self.fallback == True.
+		Otherwise, they are returned as empty arrays.
+		'''
+
+		day = import_time.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+		h = import_time.hour
+
+		data_hour = {}
+		missing = []
+		for name in value_names:
+			if not self.has_day(name, day):
+				missing.append(name)
+				continue
+
+			time, vals, hour_index = self.load_day(name, day)
+			inds = slice(hour_index[h], hour_index[h+1])
+
+			# Same conversion as datimp.read_Molly_block()
+			data_hour[name] = {
+				'time': time[inds].astype(np.float64)*86400,
+				'vals': vals[inds].astype(np.float64)
+			}
+
+		if missing:
+			if self.fallback:
+				data_hour.update(datimp.get_raw_Molly_data_hour(import_time, missing))
+			else:
+				for name in missing:
+					print(f"Warning: no archived data for '{name}' on {day.date()}")
+					data_hour[name] = {'time': np.zeros(0), 'vals': np.zeros(0)}
+
+		return data_hour
@@ -0,0 +1,292 @@
+'''
+Index of which Molly signals changed in which hour, so that step-interpolated queries can skip hour files where nothing happened.
+
+Many signals (setpoints, shutter states, etc.) only change a few times a day.
+But get_raw_Molly_data() still has to open and decode every hour file for every requested signal.
+The index records, for each day, each signal, and each hour:
+	- 'changed': whether the hour file holds anything other than the value already in force at the start of the hour
+	- 'boundary': the value in force at the start of the hour (NaN if unknown). This is the carry-forward state table.
+	- 'outside': whether the hour file holds events timed outside of its hour which aren't just copies of the value already in force at that time
+
+If none of the requested signals changed in an hour, that hour file can be skipped.
+A single (time, value) event is put at the start of the hour instead, with the boundary value.
+The value in force at every time is then unchanged, so step-interpolated data is exactly the same as reading every file.
+(Raw data and the other resampling modes do depend on every recorded event, so the index is only used for step interpolation.)
+
+The boundary values also replace the extra hour which get_raw_Molly_data() reads on each end of the time range.
+Those are only read to find the value in force at the start of the range, in case Molly stored it in a neighbouring file.
+With the index, the value in force at the start of the first hour is known, so the extra hours are dropped unless they hold something else (see 'outside').
+
+Layout of the index directory:
+	YYYY-MM-DD.npz
+
+Each .npz file holds one day, with four arrays:
+	- 'names': the (local) Molly value names indexed for that day
+	- 'changed': bool array, shape (number of names, 24)
+	- 'boundary': float32 array, shape (number of names, 24)
+	- 'outside': bool array, shape (number of names, 24)
+
+Only days which are over are indexed, since the hour files of the current day may still change.
+
+Typical usage:
+	index = MollyChangeIndex('C:\\Molly index')
+	index.update()  # Indexes all complete days since the last one indexed (or builds the first day, if empty)
+	data = get_data(start_time, end_time, value_names_list, delta_t, index = index)
+'''
+
+# Standard library imports (not included in setup.py)
+import datetime as dt
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# qncmbe imports
+from . import data_import_utils as datimp
+from . import import_profile as prof
+from .value_names import value_names_database
+
+# Non-standard library imports (included in setup.py)
+import numpy as np
+
+class MollyChangeIndex():
+	def __init__(self, index_dir, max_cached_days = 64):
+		'''
+		- index_dir is the local directory containing the index. (It is created if it doesn't exist.)
+		- max_cached_days is the number of days kept in memory after being loaded
+		'''
+
+		self.index_dir = index_dir
+		self.max_cached_days = max_cached_days
+
+		self.lock = threading.Lock()
+		self.cached_days = OrderedDict()
+
+	def get_day_path(self, day):
+		return os.path.join(self.index_dir, day.strftime('%Y-%m-%d.npz'))
+
+	def get_indexed_days(self):
+		'''
+		Returns a sorted list of all the indexed days (as datetimes)
+		'''
+
+		days = []
+		if os.path.isdir(self.index_dir):
+			for file_name in os.listdir(self.index_dir):
+				try:
+					days.append(dt.datetime.strptime(file_name, '%Y-%m-%d.npz'))
+				except ValueError:
+					pass
+
+		return sorted(days)
+
+	def index_day(self, day, value_names, num_threads = 1):
+		'''
+		Reads all the hour files for the given day (and the last hour of the previous day) and indexes the given (local) Molly value names.
+		'''
+
+		day = day.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+
+		# The last hour of the previous day gives the value in force at midnight
+		hours = [day + dt.timedelta(hours = h) for h in range(-1, 24)]
+
+		def get_hour(hour):
+			return datimp.get_raw_Molly_data_hour(hour, value_names)
+
+		with ThreadPoolExecutor(max_workers = max(num_threads, 1)) as executor:
+			data_hours = list(executor.map(get_hour, hours) if (num_threads > 1) else map(get_hour, hours))
+
+		# Times relative to midnight on day
+		data_hours[0] = {name: {'time': d['time'] - 86400, 'vals': d['vals']} for name, d in data_hours[0].items()}
+
+		changed = np.zeros((len(value_names), 24), dtype = bool)
+		boundary = np.full((len(value_names), 24), np.nan, dtype = np.float32)
+		outside = np.zeros((len(value_names), 24), dtype = bool)
+
+		hour_starts = np.arange(24)*3600.0
+
+		for n, name in enumerate(value_names):
+			time = np.concatenate([d[name]['time'] for d in data_hours])
+			vals = np.concatenate([d[name]['vals'] for d in data_hours])
+
+			sort_inds = np.argsort(time, kind = 'stable')
+			time = time[sort_inds]
+			vals = vals[sort_inds]
+
+			inds = np.searchsorted(time, hour_starts, side = 'right') - 1
+			boundary[n] = np.where(inds >= 0, vals[np.maximum(inds, 0)] if vals.size else np.nan, np.nan)
+
+			# Which file each event came from
+			file_inds = np.repeat(np.arange(-1, 24), [d[name]['time'].size for d in data_hours])[sort_inds]
+
+			for h in range(24):
+				d = data_hours[h+1][name]
+				if d['vals'].size == 0:
+					continue
+
+				# Events timed outside the hour are harmless if they are copies of the value in force at that time, according to the other files
+				out_inds = (d['time'] < hour_starts[h]) | (d['time'] >= hour_starts[h] + 3600)
+				if np.any(out_inds):
+					others = (file_inds != h)
+					other_inds = np.searchsorted(time[others], d['time'][out_inds], side = 'right') - 1
+					other_vals = vals[others][np.maximum(other_inds, 0)] if np.any(others) else np.zeros(other_inds.size)
+					outside[n, h] = np.any((other_inds < 0) | (other_vals != d['vals'][out_inds]))
+
+				changed[n, h] = np.any(d['vals'] != boundary[n, h]) or outside[n, h]
+
+		# (An interrupted build doesn't leave a broken day, see replace_file())
+		datimp.replace_file(self.get_day_path(day), lambda tmp_path: np.savez(tmp_path, names = np.array(value_names, dtype = str), changed = changed, boundary = boundary, outside = outside))
+
+		with self.lock:
+			self.cached_days.pop(day, None)
+
+	def build(self, start_day, end_day, value_names = None, overwrite = False, num_threads = 1):
+		'''
+		Indexes each day from start_day to end_day (inclusive) for the given (local) Molly value names.
+		If value_names is None, all Molly values in value_names_database are indexed.
+
+		Days that are already indexed (for all of value_names) are skipped unless overwrite == True.
+		Days which are not over yet are also skipped, since their hour files may still change.
+		'''
+
+		if value_names is None:
+			value_names = get_Molly_value_names()
+
+		day = start_day.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+
+		while day <= end_day:
+
+			if day + dt.timedelta(days = 1, hours = 1) > dt.datetime.now():
+				print(f"Skipping {day.date()}: the day is not over yet")
+
+			elif overwrite or not self.has_day(day, value_names):
+				print(f"Indexing Molly data for {day.date()}...")
+				self.index_day(day, list(value_names), num_threads)
+
+			day += dt.timedelta(days = 1)
+
+	def update(self, value_names = None, num_threads = 1):
+		'''
+		Indexes every complete day after the last indexed day. (If nothing is indexed yet, only yesterday is indexed. Use build() to go further back.)
+		Meant to be run regularly (e.g., once a day) to keep the index up to date.
+		'''
+
+		days = self.get_indexed_days()
+
+		if days:
+			start_day = days[-1] + dt.timedelta(days = 1)
+		else:
+			start_day = dt.datetime.now() - dt.timedelta(days = 1)
+
+		self.build(start_day, dt.datetime.now() - dt.timedelta(days = 1), value_names, num_threads = num_threads)
+
+	def load_day(self, day):
+		'''
+		Returns (names, changed, boundary, outside) for one indexed day, where names is a dictionary of {name: row}. See module docstring for the format.
+		Returns None if the day isn't indexed.
+		'''
+
+		with self.lock:
+			if day in self.cached_days:
+				self.cached_days.move_to_end(day)
+				return self.cached_days[day]
+
+		day_path = self.get_day_path(day)
+		if not os.path.exists(day_path):
+			return None
+
+		with np.load(day_path) as f:
+			# (Days indexed before 'outside' was added can't be used to drop the extra hours)
+			outside = f['outside'] if ('outside' in f) else np.ones(f['changed'].shape, dtype = bool)
+			day_index = ({name: n for n, name in enumerate(f['names'])}, f['changed'], f['boundary'], outside)
+
+		with self.lock:
+			self.cached_days[day] = day_index
+			while len(self.cached_days) > self.max_cached_days:
+				self.cached_days.popitem(last = False)
+
+		return day_index
+
+	def has_day(self, day, value_names):
+		day_index = self.load_day(day)
+		return (day_index is not None) and all(name in day_index[0] for name in value_names)
+
+	def get_hour_index(self, hour, value_names):
+		'''
+		Returns (changed, boundary, outside) arrays for the given hour (datetime) and (local) Molly value names, in the same order as value_names.
+		Returns None if the hour isn't indexed for all of value_names.
+		'''
+
+		day = hour.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+		day_index = self.load_day(day)
+
+		if (day_index is None) or any(name not in day_index[0] for name in value_names):
+			return None
+
+		names, changed, boundary, outside = day_index
+		rows = [names[name] for name in value_names]
+
+		return changed[rows, hour.hour], boundary[rows, hour.hour], outside[rows, hour.hour]
+
+	def skip_hours(self, hours, value_names, start_day, trim = False):
+		'''
+		Splits a list of consecutive hours (datetimes) into the hours which need to be read for the given (local) Molly value names, and the hours which can be skipped.
+
+		If trim == True, the first and last hours are taken to be the extra hours read by get_raw_Molly_data().
+		They are dropped if the index shows they aren't needed (see module docstring).
+
+		Returns (hours to read, boundary events).
+		boundary events is a dictionary of {name: {'time': ..., 'vals': ...}}, with one event at the start of each skipped hour (time relative to midnight on start_day).
+		'''
+
+		num_hours = len(hours)
+
+		# Hours which get a boundary event
+		boundary_hours = []
+
+		if trim and (len(hours) > 2):
+			first = self.get_hour_index(hours[0], value_names)
+			if (first is not None) and not np.any(first[2]) and (self.get_hour_index(hours[1], value_names) is not None):
+				hours = hours[1:]
+				boundary_hours.append(hours[0])
+
+			last = self.get_hour_index(hours[-1], value_names)
+			if (last is not None) and not np.any(last[2]):
+				hours = hours[:-1]
+
+		read_hours = []
+		for hour in hours:
+			hour_index = self.get_hour_index(hour, value_names)
+
+			if (hour_index is None) or np.any(hour_index[0]):
+				read_hours.append(hour)
+			elif hour not in boundary_hours:
+				boundary_hours.append(hour)
+
+		boundary_events = {name: {'time': [], 'vals': []} for name in value_names}
+
+		for hour in boundary_hours:
+			day = hour.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+			hour_start = (day - start_day).days*86400 + hour.hour*3600
+
+			_, boundary, _ = self.get_hour_index(hour, value_names)
+			for name, val in zip(value_names, boundary):
+				if not np.isnan(val):
+					boundary_events[name]['time'].append(hour_start)
+					boundary_events[name]['vals'].append(val)
+
+		prof.count('Molly hours skipped by index', num_hours - len(read_hours))
+
+		for name in value_names:
+			boundary_events[name]['time'] = np.array(boundary_events[name]['time'], dtype = np.float64)
+			boundary_events[name]['vals'] = np.array(boundary_events[name]['vals'], dtype = np.float32).astype(np.float64)
+
+		return read_hours, boundary_events
+
+def get_Molly_value_names():
+	'''
+	Returns all the (local) Molly value names in value_names_database, except for "Time"
+	'''
+
+	value_names = [vn['Local value name'] for vn in value_names_database.values() if vn['Location'] == 'Molly']
+	return [name for name in value_names if name != 'Time']
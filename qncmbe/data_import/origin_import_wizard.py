@@ -24,6 +24,7 @@ import traceback
 # qncmbe imports
 from qncmbe.data_import.origin_import_gui import Ui_MainWindow
 from qncmbe.data_import.data_import_utils import get_data, get_value_names_list
+import qncmbe.data_import.data_import_utils as datimp
 from qncmbe.data_import.value_names import value_names_database, get_value_names_list
 
 # Non-standard library imports (included in setup.py)
@@ -138,7 +139,7 @@ class ImportFrame(QtWidgets.QMainWindow,Ui_MainWindow):
 		# Check connections
 
 		if not generate_null_data:
-			insitudir = "\\\\insitu1.nexus.uwaterloo.ca\\Documents\\QNC MBE Data\\Production Data"
+			insitudir = datimp.production_data_path
 
 			try:
 				if not os.path.exists(insitudir):
@@ -147,7 +148,7 @@ class ImportFrame(QtWidgets.QMainWindow,Ui_MainWindow):
 				self.runtime_messages.appendPlainText(f'Error: could not find/access "{insitudir}". Check before running again.')
 				return
 
-			svtdir = "\\\\insitu1.nexus.uwaterloo.ca\\QNC_MBE_Data\\ZW-XP1"
+			svtdir = datimp.SVT_data_path
 
 			try:
 				if not os.path.exists(svtdir):
@@ -222,7 +223,7 @@ class ImportFrame(QtWidgets.QMainWindow,Ui_MainWindow):
 			if generate_null_data:
 				data = {val: [] for val in all_value_names}
 			else:
-				data = get_data(start_time, end_time, all_value_names, t_step)
+				data = get_data(start_time, end_time, all_value_names, t_step, parallel = True)
 
 			self.runtime_messages.appendPlainText("Writing data to Origin...")
 			self.runtime_messages.repaint()
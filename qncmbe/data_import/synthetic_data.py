@@ -0,0 +1,235 @@
+'''
+Generates synthetic lab data, laid out exactly like the server, so that data imports can be tested and benchmarked without access to the lab.
+
+The data root has the same layout as the server (see data_import_utils.set_data_root()):
+	<root_dir>/Production Data/Molly data/YYYY/MM-Mon/DDday-HHhr.txt (and DDday-HHhr-binary.txt)
+	<root_dir>/Production Data/BET data/BET ....dat
+	<root_dir>/Production Data/ISP data/ISP ....dat
+	<root_dir>/ZW-XP1/<growth>/<growth>_<Engine 1, IS4K Temp, or IS4K Refl>.txt
+	<root_dir>/file_times.json
+
+Molly data:
+	Every Molly value in value_names_database gets a stream of changes, written into the hour files in Molly's format.
+	Measured values (Measured, Reading, Value, OutputPercent) change changes_per_hour times per hour on average, as a random walk.
+	Setpoints, ramp rates, and statuses change a few times a day, and shutters switch between 0 and 1.
+	As in the real files, each hour file also repeats the last change before the hour (sometimes at a negative time).
+
+BET/ISP and SVT data:
+	One set of files is written for each growth, timed relative to the file creation time.
+	The creation times can't be set on most systems, so the intended creation and modification times are saved in file_times.json.
+
+Typical usage:
+	generate_data_root('C:\\Synthetic data', dt.datetime(2019,8,1), dt.datetime(2019,9,1))
+	set_data_root('C:\\Synthetic data')
+	data = get_data(...)
+'''
+
+# Standard library imports (not included in setup.py)
+import datetime as dt
+import os
+import json
+
+# qncmbe imports
+from .value_names import value_names_database
+
+# Non-standard library imports (included in setup.py)
+import numpy as np
+
+# Columns in each SVT file (time first)
+SVT_columns = {
+	'Engine 1': 5,
+	'IS4K Temp': 4,
+	'IS4K Refl': 3
+}
+
+def generate_data_root(root_dir, start_time, end_time, value_names = None, changes_per_hour = 30, growths_per_day = 1, growth_hours = 6, BET_period = 5.0, SVT_period = 2.0, seed = 0):
+	'''
+	Writes synthetic Molly, BET/ISP, and SVT data covering start_time to end_time into root_dir.
+
+	- value_names is a list of local Molly value names. If None, all Molly values in value_names_database are used.
+	- changes_per_hour is the average number of changes per hour for each measured Molly value
+	- growths_per_day and growth_hours set the number and length of growths, which each get a set of BET/ISP and SVT files
+	- BET_period and SVT_period are the time between rows of the BET/ISP and SVT files, in seconds
+	- seed is the random seed, so the same arguments always give the same data
+
+	Returns a dictionary with the number of files and bytes written.
+	'''
+
+	rng = np.random.default_rng(seed)
+
+	growths = get_growth_times(start_time, end_time, growths_per_day, growth_hours)
+
+	stats = generate_Molly_data(root_dir, start_time, end_time, value_names, changes_per_hour, rng)
+
+	file_times = {}
+	for n, (growth_start, growth_end) in enumerate(growths):
+		growth_stats = generate_growth_data(root_dir, f'G{n+1:04d}', growth_start, growth_end, BET_period, SVT_period, rng, file_times)
+		for key in stats:
+			stats[key] += growth_stats[key]
+
+	with open(os.path.join(root_dir, 'file_times.json'), 'w') as f:
+		json.dump(file_times, f, indent = 1)
+
+	return stats
+
+def get_growth_times(start_time, end_time, growths_per_day = 1, growth_hours = 6):
+	'''
+	Returns a list of (start, end) times of the growths between start_time and end_time.
+	Growths are spread evenly through each day, starting at 08:00.
+	'''
+
+	growths = []
+
+	day = start_time.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+	while day < end_time:
+		for n in range(growths_per_day):
+			growth_start = day + dt.timedelta(hours = 8 + n*24/max(growths_per_day, 1))
+			growth_end = growth_start + dt.timedelta(hours = growth_hours)
+
+			if (growth_start >= start_time) and (growth_end <= end_time):
+				growths.append((growth_start, growth_end))
+
+		day += dt.timedelta(days = 1)
+
+	return growths
+
+def get_Molly_value_kind(name):
+	'''
+	Returns 'measured', 'setting', or 'shutter', depending on how often and how the value changes
+	'''
+
+	if name.endswith('ShutterStatus'):
+		return 'shutter'
+	elif name.endswith(('Setpoint', 'RampRate', 'Status')):
+		return 'setting'
+	else:
+		return 'measured'
+
+def generate_Molly_data(root_dir, start_time, end_time, value_names = None, changes_per_hour = 30, rng = None):
+	'''
+	Writes the Molly hour files (header and binary) for every hour from start_time to end_time, with one hour extra on each end.
+	See generate_data_root()
+	'''
+
+	if value_names is None:
+		value_names = [vn['Local value name'] for vn in value_names_database.values() if vn['Location'] == 'Molly']
+		value_names = [name for name in value_names if name != 'Time']
+
+	if rng is None:
+		rng = np.random.default_rng(0)
+
+	kinds = [get_Molly_value_kind(name) for name in value_names]
+	rates = {'measured': changes_per_hour, 'setting': 0.2, 'shutter': 2.0}
+
+	# Starting level and last change (time in seconds relative to the current day, value) of each value
+	levels = rng.uniform(0, 1000, len(value_names))
+	last = [(-3600.0, 0.0 if kind == 'shutter' else level) for kind, level in zip(kinds, levels)]
+
+	stats = {'files': 0, 'bytes': 0}
+
+	hour = start_time.replace(minute = 0, second = 0, microsecond = 0) - dt.timedelta(hours = 1)
+	while hour <= end_time + dt.timedelta(hours = 1):
+
+		hour_start = hour.hour*3600.0
+
+		header_lines = []
+		blocks = []
+		offset = 0
+		for n, (name, kind) in enumerate(zip(value_names, kinds)):
+
+			num_changes = rng.poisson(rates[kind])
+			time = np.sort(rng.uniform(hour_start, hour_start + 3600, num_changes))
+
+			if kind == 'shutter':
+				vals = (last[n][1] + np.arange(1, num_changes + 1)) % 2
+			elif kind == 'setting':
+				vals = np.round(rng.uniform(0, 1000, num_changes))
+			else:
+				vals = last[n][1] + np.cumsum(rng.normal(0, 0.1, num_changes))
+
+			# Repeat the last change before the hour
+			time = np.concatenate([[last[n][0]], time])
+			vals = np.concatenate([[last[n][1]], vals])
+
+			last[n] = (time[-1], vals[-1])
+
+			block = np.empty((time.size, 2), dtype = np.float32)
+			block[:,0] = time/86400
+			block[:,1] = vals
+			blocks.append(block)
+
+			header_lines.append(f'DataItem=Name:{name};Units:;TotalValues:{time.size};ValueOffset:{offset}\n')
+			offset += time.size
+
+		dir_path = os.path.join(root_dir, 'Production Data', 'Molly data', hour.strftime('%Y'), hour.strftime('%m-%b'))
+		os.makedirs(dir_path, exist_ok = True)
+
+		with open(os.path.join(dir_path, hour.strftime('%dday-%Hhr.txt')), 'w') as f:
+			f.write('[DataItems]\n')
+			f.writelines(header_lines)
+			stats['bytes'] += f.tell()
+
+		# The first pair in the binary file is unused (see get_data_from_binary())
+		with open(os.path.join(dir_path, hour.strftime('%dday-%Hhr-binary.txt')), 'wb') as f:
+			f.write(np.zeros(2, dtype = np.float32).tobytes())
+			for block in blocks:
+				f.write(block.tobytes())
+			stats['bytes'] += f.tell()
+
+		stats['files'] += 2
+
+		# Molly time is relative to midnight, so the last changes have to be shifted at the end of each day
+		hour += dt.timedelta(hours = 1)
+		if hour.hour == 0:
+			last = [(time - 86400, val) for time, val in last]
+
+	return stats
+
+def generate_growth_data(root_dir, growth, growth_start, growth_end, BET_period = 5.0, SVT_period = 2.0, rng = None, file_times = None):
+	'''
+	Writes the BET, ISP, and SVT files for a single growth, adding their creation and modification times to file_times.
+	See generate_data_root()
+	'''
+
+	if rng is None:
+		rng = np.random.default_rng(0)
+	if file_times is None:
+		file_times = {}
+
+	stats = {'files': 0, 'bytes': 0}
+
+	tot_seconds = (growth_end - growth_start).total_seconds()
+
+	def write_file(rel_path, header, data, fmt):
+		file_path = os.path.join(root_dir, *rel_path.split('/'))
+		os.makedirs(os.path.dirname(file_path), exist_ok = True)
+
+		with open(file_path, 'w') as f:
+			f.write(header)
+			np.savetxt(f, data, fmt = fmt, delimiter = '\t')
+			stats['bytes'] += f.tell()
+
+		stats['files'] += 1
+
+		file_times[rel_path] = {'ctime': growth_start.timestamp(), 'mtime': growth_end.timestamp()}
+		os.utime(file_path, (growth_end.timestamp(), growth_end.timestamp()))
+
+	# BET and ISP data: time in seconds since the file was created
+	time = np.arange(0, tot_seconds, BET_period)
+
+	BET_data = np.column_stack([time, 500 + np.cumsum(rng.normal(0, 0.05, time.size))])
+	write_file(f'Production Data/BET data/BET {growth_start:%Y-%m-%d %H-%M-%S}.dat', 'Time (s)\tTemperature (C)\n', BET_data, '%.3f')
+
+	ISP_data = np.column_stack([time, rng.uniform(0, 1e5, time.size), 500 + np.cumsum(rng.normal(0, 0.05, time.size))])
+	write_file(f'Production Data/ISP data/ISP {growth_start:%Y-%m-%d %H-%M-%S}.dat', 'Time (s)\tIntegral\tTemperature (C)\n', ISP_data, '%.3f')
+
+	# SVT data: time in days since midnight on the day the file was created, after 3 header lines
+	midnight = growth_start.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+	time = ((growth_start - midnight).total_seconds() + np.arange(0, tot_seconds, SVT_period))/86400
+
+	for subloc, num_cols in SVT_columns.items():
+		SVT_data = np.column_stack([time] + [rng.uniform(0, 1, time.size) for n in range(num_cols - 1)])
+		header = f'{growth} {subloc}\n{growth_start:%Y-%m-%d %H:%M:%S}\n\n'
+		write_file(f'ZW-XP1/{growth}/{growth}_{subloc}.txt', header, SVT_data, '%.8f')
+
+	return stats